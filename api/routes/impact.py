@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from schemas.impact import (
     ImpactGenerateRequest,
@@ -12,12 +14,14 @@ from schemas.impact import (
 from schemas.voice import VoiceTokenRequest, VoiceTokenResponse
 from schemas.error import ErrorResponse
 from schemas.common import Envelope
+from api.sse import SSE_HEADERS, sse_event
 from services import impact as impact_service
 from services.voice_tokens import create_ephemeral_token
-from core.database import get_db
-from api.deps import get_current_active_user, rate_limit_standard, rate_limit_ai
+from core.database import SessionLocal, get_db
+from api.deps import get_current_active_user, get_current_user, rate_limit_standard, rate_limit_ai
 
 from core.config import settings
+from core.logging import logger
 from services.turnstile import verify_turnstile_token
 
 router = APIRouter(prefix="/impact", tags=["impact"])
@@ -47,14 +51,75 @@ def list_impacts(
         503: {"model": ErrorResponse, "description": "AI client unavailable"},
     },
 )
-def generate_impact(
+async def generate_impact(
     request: Request,
     data: ImpactGenerateRequest,
     current_user=Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
-    verify_turnstile_token(data.turnstile_token, secret_key=settings.TURNSTILE_SECRET_KEY_AI_ACTIONS, remote_ip=request.client.host)
-    impact, steps = impact_service.create_impact_from_prompt(db, current_user, data.topic)
+    # Async so the 10-30s Gemini call doesn't pin a threadpool thread;
+    # blocking Turnstile/DB work is pushed to the threadpool.
+    await run_in_threadpool(
+        verify_turnstile_token,
+        data.turnstile_token,
+        secret_key=settings.TURNSTILE_SECRET_KEY_AI_ACTIONS,
+        remote_ip=request.client.host,
+    )
+    impact, steps = await impact_service.create_impact_from_prompt_async(db, current_user, data.topic)
+    # Reading committed rows may lazy-load, so build the response off the loop too
+    return await run_in_threadpool(_impact_response, impact, steps)
+
+
+@router.post(
+    "/generate/stream",
+    response_class=StreamingResponse,
+    dependencies=[Depends(rate_limit_ai)],
+    responses={401: {"model": ErrorResponse, "description": "Not authenticated"}},
+)
+async def generate_impact_stream(
+    request: Request,
+    data: ImpactGenerateRequest,
+    user_id: str = Depends(get_current_user),
+):
+    """
+    Streaming variant of POST /impact/generate over Server-Sent Events.
+    Emits title, description and step events as the plan is generated, then
+    complete with the same payload /impact/generate returns. Failures after
+    the stream has started arrive as an error event carrying the usual
+    {code, message} detail; nothing is persisted in that case.
+    """
+    await run_in_threadpool(
+        verify_turnstile_token,
+        data.turnstile_token,
+        secret_key=settings.TURNSTILE_SECRET_KEY_AI_ACTIONS,
+        remote_ip=request.client.host,
+    )
+    current_user = await run_in_threadpool(_load_active_user, user_id)
+
+    async def event_stream():
+        try:
+            async for event, payload in impact_service.stream_impact_from_prompt(current_user, data.topic):
+                if event == "complete":
+                    response = await run_in_threadpool(_impact_response, payload["impact"], payload["steps"])
+                    payload = response.data.model_dump()
+                yield sse_event(event, payload)
+        except HTTPException as exc:
+            yield sse_event("error", exc.detail if isinstance(exc.detail, dict) else {"message": str(exc.detail)})
+        except Exception:
+            logger.exception("Streaming impact generation failed")
+            yield sse_event("error", {"code": "internal_error", "message": "Impact generation failed"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def _load_active_user(user_id: str):
+    # Own short-lived session: the request-scoped one would hold a pooled
+    # connection idle-in-transaction until the stream ends
+    with SessionLocal() as db:
+        return get_current_active_user(user_id, db)
+
+
+def _impact_response(impact, steps) -> Envelope[ImpactResponse]:
     return Envelope(
         data=ImpactResponse(
             id=str(impact.id),
@@ -1,26 +1,42 @@
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import uuid
 
-from core.database import get_db
+from core.database import SessionLocal, get_db
 from api.deps import get_current_user, rate_limit_standard, rate_limit_ai
 from services.material_service import (
     create_initial_material, 
     get_material,
     list_materials,
     update_material,
-    delete_material
+    delete_material,
+    retry_material
 )
 from services.material_queue import enqueue_material
+from services.material_events import material_events, TERMINAL_EVENTS
 from schemas.materials import MaterialResponse, MaterialUpdate
 from schemas.common import Envelope
+from api.sse import SSE_HEADERS, sse_event
 
 from core.config import settings
 from services.turnstile import verify_turnstile_token
 
 router = APIRouter(prefix="/materials", tags=["materials"])
 
+def _image_too_large() -> HTTPException:
+    limit_mb = settings.MATERIAL_UPLOAD_MAX_BYTES / (1024 * 1024)
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"Image size exceeds {limit_mb:g}MB limit",
+    )
+
+def _enqueue_and_respond(material, db: Session) -> Envelope[MaterialResponse]:
+    enqueue_material(material.id, db)
+    return Envelope(data=MaterialResponse.model_validate(material))
+
 @router.post("/generate", response_model=Envelope[MaterialResponse], status_code=status.HTTP_202_ACCEPTED)
 async def generate_material(
     request: Request,
@@ -34,31 +50,34 @@ async def generate_material(
     """
     Create a new material and start the AI generation pipeline in the background.
     Returns the initial record immediately.
+    Blocking work (Turnstile, image decode, R2 upload, DB) runs in the threadpool
+    so uploads don't stall the event loop. Oversized bodies are rejected from
+    Content-Length by middleware before the multipart body is parsed.
     """
-    verify_turnstile_token(turnstile_token, secret_key=settings.TURNSTILE_SECRET_KEY_AI_ACTIONS, remote_ip=request.client.host)
+    await run_in_threadpool(
+        verify_turnstile_token,
+        turnstile_token,
+        secret_key=settings.TURNSTILE_SECRET_KEY_AI_ACTIONS,
+        remote_ip=request.client.host,
+    )
     if not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
-    # Enforce 5MB limit
-    MAX_SIZE = 5 * 1024 * 1024 # 5MB
-    image.file.seek(0, 2) # Seek to end
-    file_size = image.file.tell()
-    image.file.seek(0) # Seek back to start
-    
-    if file_size > MAX_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_413_PAYLOAD_TOO_LARGE, 
-            detail="Image size exceeds 5MB limit"
-        )
+    # Enforce size limit (chunked uploads carry no Content-Length)
+    if image.size is not None and image.size > settings.MATERIAL_UPLOAD_MAX_BYTES:
+        raise _image_too_large()
 
     try:
         # Read file into memory
         file_bytes = await image.read()
+        if len(file_bytes) > settings.MATERIAL_UPLOAD_MAX_BYTES:
+            raise _image_too_large()
         
         owner_uuid = uuid.UUID(user_id)
         
-        # Create initial record synchronously (and upload to R2)
-        material = create_initial_material(
+        # Create initial record off the event loop (image decode + R2 upload)
+        material = await run_in_threadpool(
+            create_initial_material,
             title=title,
             image_bytes=file_bytes,
             content_type=image.content_type,
@@ -66,11 +85,14 @@ async def generate_material(
             db=db
         )
         
-        # Trigger background pipeline via dedicated queue
-        enqueue_material(material.id)
-        
-        return Envelope(data=MaterialResponse.model_validate(material))
+        # Trigger background pipeline via dedicated queue; the enqueue commit
+        # expires the row, so the response is built off the loop as well
+        return await run_in_threadpool(_enqueue_and_respond, material, db)
 
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -130,6 +152,24 @@ def delete_user_material(
         raise HTTPException(status_code=404, detail="Material not found")
     return None
 
+@router.post("/{material_id}/retry", response_model=Envelope[MaterialResponse], status_code=status.HTTP_202_ACCEPTED)
+def retry_failed_material(
+    material_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_current_user),
+    _ = Depends(rate_limit_ai)
+):
+    """Re-run a failed material, resuming from its last completed stage."""
+    owner_uuid = uuid.UUID(user_id)
+    try:
+        material = retry_material(db, material_id, owner_uuid)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    if not material:
+        raise HTTPException(status_code=404, detail="Material not found")
+    enqueue_material(material.id, db)
+    return Envelope(data=MaterialResponse.model_validate(material))
+
 @router.get("/{material_id}/status", status_code=status.HTTP_200_OK)
 def get_material_status(
     material_id: uuid.UUID,
@@ -150,4 +190,61 @@ def get_material_status(
             "status": material.status,
             "error_message": material.error_message
         }
-    }
\ No newline at end of file
+    }
+
+def _status_snapshot(material_id: uuid.UUID, owner_id: uuid.UUID) -> Optional[dict]:
+    # Own short-lived session: a request-scoped one would hold a pooled
+    # connection idle-in-transaction until the stream ends
+    with SessionLocal() as db:
+        material = get_material(db, material_id, owner_id)
+        if not material:
+            return None
+        return {
+            "id": str(material.id),
+            "status": material.status,
+            "error_message": material.error_message,
+        }
+
+@router.get("/{material_id}/events", response_class=StreamingResponse)
+async def stream_material_events(
+    material_id: uuid.UUID,
+    request: Request,
+    user_id: str = Depends(get_current_user),
+    _ = Depends(rate_limit_standard)
+):
+    """
+    Server-Sent Events stream of pipeline progress for one material.
+    Sends the current status first, then processing, description_ready,
+    cover_ready, way_ready, ready and failed events as the worker emits them.
+    Replaces polling GET /materials/{id}/status.
+    """
+    owner_uuid = uuid.UUID(user_id)
+    # Subscribe before reading the snapshot so no transition falls in between
+    subscription = material_events.subscribe(material_id)
+    snapshot = await run_in_threadpool(_status_snapshot, material_id, owner_uuid)
+    if not snapshot:
+        material_events.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail="Material not found")
+
+    async def event_stream():
+        try:
+            yield sse_event("status", snapshot)
+            if snapshot["status"] in TERMINAL_EVENTS:
+                return
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=settings.MATERIAL_EVENTS_HEARTBEAT_SECONDS)
+                if event is None:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_event(event["event"], event["data"])
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            material_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
@@ -1,7 +1,9 @@
 from fastapi import APIRouter
 from schemas.common import Envelope
-from schemas.system import LimitsResponse, RateLimitInfo
+from schemas.system import LimitsResponse, RateLimitInfo, QueueStatsResponse, MetricsResponse
 from core.config import settings
+from core.metrics import metrics
+from services.material_queue import get_queue_stats
 
 router = APIRouter(prefix="/system", tags=["system"])
 
@@ -20,4 +22,15 @@ def limits():
                 per_ip_per_minute=settings.RATE_LIMIT_AUTH_PER_MINUTE,
             )
         )
-    )
\ No newline at end of file
+    )
+
+
+@router.get("/queue", response_model=Envelope[QueueStatsResponse])
+def queue_stats():
+    return Envelope(data=QueueStatsResponse(**get_queue_stats()))
+
+
+@router.get("/metrics", response_model=Envelope[MetricsResponse])
+def metrics_snapshot():
+    """Per-process counters and latency histograms (pipeline stages, Gemini calls, R2, jobs)."""
+    return Envelope(data=MetricsResponse(**metrics.snapshot()))
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark and regression check for services.ai.json_extract.
+
+Runs every corpus case through the current extractor (and the previous
+regex-based implementation for comparison), verifies expected values and
+errors, then times both.
+
+    python benchmarks/json_extract/bench.py [--iterations 2000]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, ROOT)
+
+from services.ai.json_extract import extract_json  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus.json")
+
+
+def legacy_extract_json(text: str):
+    """BaseGeminiClient._extract_json before the single-pass rewrite, kept for comparison."""
+    if not text:
+        raise ValueError("Empty AI response")
+    cleaned = text.strip()
+    if "```" in cleaned:
+        match = re.search(r"```json\s*(.*?)\s*```", cleaned, re.DOTALL)
+        if match:
+            cleaned = match.group(1)
+        else:
+            match = re.search(r"```\s*(.*?)\s*```", cleaned, re.DOTALL)
+            if match:
+                cleaned = match.group(1)
+    cleaned = cleaned.strip()
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        for opener, closer in (("{", "}"), ("[", "]")):
+            start = cleaned.find(opener)
+            end = cleaned.rfind(closer)
+            if start != -1 and end != -1:
+                try:
+                    return json.loads(cleaned[start:end + 1])
+                except json.JSONDecodeError:
+                    pass
+        raise ValueError("Could not extract valid JSON from AI response")
+
+
+def _outcome(fn, text):
+    try:
+        return True, fn(text)
+    except ValueError:
+        return False, None
+
+
+def check(cases) -> int:
+    failures = 0
+    for case in cases:
+        ok, value = _outcome(extract_json, case["text"])
+        legacy_ok, legacy_value = _outcome(legacy_extract_json, case["text"])
+        if case.get("error"):
+            passed = not ok
+        elif "expected" in case:
+            passed = ok and value == case["expected"]
+        else:
+            passed = True
+        legacy_passed = (not legacy_ok) if case.get("error") else (
+            legacy_ok and legacy_value == case["expected"] if "expected" in case else True
+        )
+        failures += not passed
+        print(f"{'ok  ' if passed else 'FAIL'} {case['name']:<28} legacy: {'ok' if legacy_passed else 'wrong'}")
+    return failures
+
+
+def bench(cases, iterations: int):
+    print(f"\n{'case':<28} {'legacy us':>10} {'current us':>11} {'speedup':>8}")
+    for case in cases:
+        if case.get("error"):
+            continue
+        text = case["text"]
+        legacy = timeit.timeit(lambda: _outcome(legacy_extract_json, text), number=iterations) / iterations * 1e6
+        current = timeit.timeit(lambda: _outcome(extract_json, text), number=iterations) / iterations * 1e6
+        print(f"{case['name']:<28} {legacy:>10.1f} {current:>11.1f} {legacy / current:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS, encoding="utf-8") as f:
+        cases = json.load(f)
+    failures = check(cases)
+    bench(cases, args.iterations)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
@@ -17,9 +18,113 @@ class Settings(BaseSettings):
     MAX_REFRESH_TOKENS_PER_USER: int = 5
 
     IMPACT_GENERATION_MODEL: str = "gemini-2.5-flash"
+    IMPACT_EMBEDDING_MODEL: str = "gemini-embedding-001"
+    IMPACT_EMBEDDING_DIMENSIONS: int = 256
     MATERIAL_TEXT_GENERATION_MODEL: str = "gemini-2.5-flash"
     MATERIAL_IMG_GENERATION_MODEL: str = "gemini-2.5-flash-image"
 
+    # Gemini concurrency: process-wide cap per model, overridable per model
+    # (GEMINI_MODEL_CONCURRENCY='{"gemini-2.5-flash-image": 4}')
+    GEMINI_MAX_CONCURRENCY: int = 16
+    GEMINI_MODEL_CONCURRENCY: dict[str, int] = {}
+
+    # Gemini Response Cache
+    # Keyed by a hash of model, prompt, config and attached bytes. Only methods
+    # listed in GEMINI_CACHE_METHODS are cached; add "generate_image" to reuse
+    # generated images. GEMINI_CACHE_DIR enables the on-disk tier.
+    GEMINI_CACHE_ENABLED: bool = True
+    GEMINI_CACHE_METHODS: list[str] = [
+        "generate_impact_payload",
+        "describe_material",
+        "generate_ways_json",
+        "generate_step_guide",
+        "analyze_material",
+    ]
+    GEMINI_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    GEMINI_CACHE_MAX_ENTRIES: int = 512
+    GEMINI_CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+    GEMINI_CACHE_DIR: str = ""
+    # Concurrent identical requests share one upstream call
+    GEMINI_SINGLEFLIGHT_ENABLED: bool = True
+
+    # Gemini resilience: per-model circuit breaker (fails fast with 503 while
+    # open, probes after GEMINI_BREAKER_RESET_SECONDS) and hedged requests for
+    # short calls, sent once the first attempt exceeds the latency percentile.
+    GEMINI_REQUEST_TIMEOUT_SECONDS: int = 120
+    GEMINI_BREAKER_ENABLED: bool = True
+    GEMINI_BREAKER_FAILURE_THRESHOLD: int = 5
+    GEMINI_BREAKER_RESET_SECONDS: float = 30.0
+    GEMINI_HEDGE_METHODS: list[str] = ["describe_material", "embed_topic"]
+    GEMINI_HEDGE_PERCENTILE: float = 0.95
+    GEMINI_HEDGE_MIN_SAMPLES: int = 20
+    GEMINI_HEDGE_MIN_DELAY_SECONDS: float = 1.0
+    GEMINI_HEDGE_MAX_IN_FLIGHT: int = 8
+
+    # Gemini transport: live (SDK), record (live + save cassettes), replay
+    # (serve cassettes only) or fake (synthetic output, no API key needed).
+    # Fake latency is log-normal per model from [median_ms, p95_ms].
+    GEMINI_TRANSPORT: str = "live"
+    GEMINI_CASSETTE_DIR: str = "cassettes"
+    GEMINI_FAKE_LATENCY_MS: dict[str, list[float]] = {
+        "default": [800, 2500],
+        "gemini-2.5-flash-image": [6000, 12000],
+    }
+    GEMINI_FAKE_SEED: Optional[int] = None
+
+    # Gemini Files API: the material photo is uploaded once per pipeline run
+    # and referenced by URI; off (or non-live transports) sends it inline.
+    GEMINI_FILES_API_ENABLED: bool = True
+
+    # Impact Topic Cache
+    # Validated plans are reused for near-duplicate topics (cosine similarity of
+    # topic embeddings >= threshold) from users in the same profile bucket.
+    IMPACT_CACHE_ENABLED: bool = True
+    IMPACT_CACHE_SIMILARITY_THRESHOLD: float = 0.92
+    IMPACT_CACHE_MAX_CANDIDATES: int = 500
+    IMPACT_CACHE_TTL_DAYS: int = 30
+
+    # Material Pipeline
+    MATERIAL_UPLOAD_MAX_BYTES: int = 5 * 1024 * 1024
+    MATERIAL_PIPELINE_MAX_PARALLEL: int = 4
+    # One multimodal call for description + ways; false = the two-call flow
+    MATERIAL_COMBINED_ANALYSIS: bool = True
+    MATERIAL_WORKER_COUNT: int = 2
+    MATERIAL_WORKER_MAX_IN_FLIGHT: int = 1
+    MATERIAL_WORKER_SHUTDOWN_TIMEOUT_SECONDS: int = 120
+    MATERIAL_JOB_MAX_ATTEMPTS: int = 3
+    MATERIAL_JOB_VISIBILITY_TIMEOUT_SECONDS: int = 600
+    MATERIAL_JOB_RETRY_BACKOFF_SECONDS: int = 30
+    MATERIAL_JOB_POLL_INTERVAL_SECONDS: float = 2.0
+    MATERIAL_JOB_REAPER_INTERVAL_SECONDS: int = 60
+    MATERIAL_EVENTS_USE_PG_NOTIFY: bool = True
+    MATERIAL_EVENTS_HEARTBEAT_SECONDS: int = 15
+
+    # Image normalization (IMAGE_OUTPUT_FORMAT: WEBP, AVIF, JPEG or PNG)
+    IMAGE_OUTPUT_FORMAT: str = "WEBP"
+    IMAGE_OUTPUT_QUALITY: int = 85
+    ORIGINAL_IMAGE_MAX_EDGE: int = 2048
+    AI_REFERENCE_IMAGE_MAX_EDGE: int = 1024
+    AI_REFERENCE_IMAGE_QUALITY: int = 80
+
+    # Generated covers: fitted inside the box keeping aspect ratio, then
+    # encoded in a process pool (0 workers = inline in the calling thread)
+    GENERATED_IMAGE_FORMAT: str = "WEBP"
+    GENERATED_IMAGE_QUALITY: int = 80
+    GENERATED_IMAGE_MAX_WIDTH: int = 960
+    GENERATED_IMAGE_MAX_HEIGHT: int = 540
+    IMAGE_PROCESS_POOL_WORKERS: int = 2
+
+    # Responsive derivatives of stored images (widths below the source only)
+    # and the width of the blur-up placeholder kept on the row
+    IMAGE_VARIANT_WIDTHS: list[int] = [320, 640, 1280]
+    IMAGE_VARIANT_QUALITY: int = 75
+    IMAGE_PLACEHOLDER_WIDTH: int = 16
+
+    # Local hand-off of uploaded images to workers (empty dir = system temp)
+    HANDOFF_CACHE_MAX_MEMORY_BYTES: int = 64 * 1024 * 1024
+    HANDOFF_CACHE_MAX_SPILL_BYTES: int = 512 * 1024 * 1024
+    HANDOFF_CACHE_DIR: str = ""
+
     GOOGLE_API_KEY: str
 
     # Cloudflare R2 Configuration
@@ -28,6 +133,25 @@ class Settings(BaseSettings):
     R2_SECRET_ACCESS_KEY: str
     R2_BUCKET: str
     R2_PUBLIC_URL: str = "https://r2.devlix.org"
+    # Transfers: connection pool shared by all threads, botocore "standard"
+    # retries (attempts include the first try) and bulk-transfer parallelism
+    R2_MAX_POOL_CONNECTIONS: int = 32
+    R2_MAX_ATTEMPTS: int = 4
+    R2_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    R2_READ_TIMEOUT_SECONDS: float = 60.0
+    R2_TCP_KEEPALIVE: bool = True
+    R2_TRANSFER_CONCURRENCY: int = 8
+
+    # Storage garbage collection: deleted materials leave tombstones that a
+    # background collector empties in batches; each prefix is swept again
+    # after the re-sweep delay to catch uploads from a still-running job
+    STORAGE_GC_ENABLED: bool = True
+    STORAGE_GC_INTERVAL_SECONDS: float = 30.0
+    STORAGE_GC_BATCH_PREFIXES: int = 200
+    STORAGE_GC_RESWEEP_SECONDS: int = 900
+    STORAGE_GC_RETRY_BACKOFF_SECONDS: int = 60
+    STORAGE_GC_MAX_BACKOFF_SECONDS: int = 3600
+    STORAGE_GC_LEASE_SECONDS: int = 300
 
     # Cloudflare Turnstile Configuration
     TURNSTILE_SECRET_KEY_AUTH: str
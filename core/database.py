@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from core.config import settings
 
@@ -13,6 +13,27 @@ SessionLocal = sessionmaker(bind=engine, autoflush=False)
 class Base(DeclarativeBase):
     pass
 
+# create_all only creates missing tables, so columns added to existing
+# tables are listed here and applied idempotently at startup
+COLUMN_UPGRADES = [
+    "ALTER TABLE materials ADD COLUMN IF NOT EXISTS image_variants JSON",
+    "ALTER TABLE materials ADD COLUMN IF NOT EXISTS image_placeholder TEXT",
+    "ALTER TABLE materials ADD COLUMN IF NOT EXISTS original_image_variants JSON",
+    "ALTER TABLE material_ways ADD COLUMN IF NOT EXISTS image_variants JSON",
+    "ALTER TABLE material_ways ADD COLUMN IF NOT EXISTS image_placeholder TEXT",
+]
+
+# Arbitrary key serializing schema setup across processes starting together
+_SCHEMA_LOCK_KEY = 7254061
+
+def init_db():
+    """Create missing tables and apply COLUMN_UPGRADES; models must be imported first."""
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SCHEMA_LOCK_KEY})
+        Base.metadata.create_all(bind=conn)
+        for statement in COLUMN_UPGRADES:
+            conn.execute(text(statement))
+
 def get_db():
     db = SessionLocal()
     try:
@@ -64,11 +64,19 @@ export interface ImpactResponse {
     steps: ImpactStepResponse[];
 }
 
+export interface ImageVariant {
+    width: number;
+    height: number;
+    uri: string;
+}
+
 export interface MaterialWay {
     id: string;
     title: string;
     description: string;
     image_uri?: string;
+    image_variants?: ImageVariant[];
+    image_placeholder?: string;
     md: string;
     created_at: string;
 }
@@ -80,7 +88,10 @@ export interface Material {
     status: 'queued' | 'processing' | 'ready' | 'failed';
     error_message?: string;
     image_uri?: string;
+    image_variants?: ImageVariant[];
+    image_placeholder?: string;
     original_image_uri?: string;
+    original_image_variants?: ImageVariant[];
     created_at: string;
     ways: MaterialWay[];
 }
\ No newline at end of file
@@ -1,14 +1,17 @@
 import uuid
 from pathlib import Path
-from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Request, status
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.exceptions import HTTPException, RequestValidationError
 from mangum import Mangum
 from api.routes import auth, impact, users, system, materials
-from core.database import Base, engine
+from core.database import init_db
 from core.error_handling import http_exception_handler, generic_exception_handler, validation_exception_handler
+from schemas.error import ErrorResponse
 from fastapi.middleware.cors import CORSMiddleware
+from services.image_processing import image_pool
 from services.material_queue import start_worker, stop_worker
+from services.storage_gc import start_collector, stop_collector
 from core.config import settings
 
 app = FastAPI(
@@ -39,12 +42,34 @@ app = FastAPI(
 
 @app.on_event("startup")
 def on_startup():
-    Base.metadata.create_all(bind=engine)
+    init_db()
     start_worker()
+    start_collector()
 
 @app.on_event("shutdown")
 def on_shutdown():
     stop_worker()
+    stop_collector()
+    image_pool.shutdown()
+
+# Max request body per upload route; allows for multipart framing around the file
+UPLOAD_LIMITS = {
+    "/materials/generate": settings.MATERIAL_UPLOAD_MAX_BYTES + 64 * 1024,
+}
+
+# Registered before CORS so CORS wraps (and decorates) the 413 responses
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    limit = UPLOAD_LIMITS.get(request.url.path)
+    content_length = request.headers.get("content-length")
+    if limit and content_length and content_length.isdigit() and int(content_length) > limit:
+        return JSONResponse(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            content=ErrorResponse(
+                error={"code": "payload_too_large", "message": "Request body too large"}
+            ).model_dump(),
+        )
+    return await call_next(request)
 
 app.add_middleware(
     CORSMiddleware,
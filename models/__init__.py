@@ -4,3 +4,7 @@ from .step import Step
 from .refresh_token import RefreshToken
 from .material import Material
 from .material_way import MaterialWay
+from .material_job import MaterialJob
+from .material_checkpoint import MaterialCheckpoint
+from .impact_template import ImpactTemplate
+from .storage_tombstone import StorageTombstone
@@ -0,0 +1,27 @@
+import uuid
+from sqlalchemy import Column, String, DateTime, Integer, JSON
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class ImpactTemplate(Base):
+    """A validated impact plan kept for reuse by similar topics from similar profiles."""
+
+    __tablename__ = "impact_templates"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # Normalized topic text and coarse profile bucket (age band + interest set)
+    topic = Column(String, nullable=False, index=True)
+    profile_bucket = Column(String, nullable=False, index=True)
+
+    # Unit-length topic embedding, so cosine similarity is a dot product
+    embedding = Column(JSON, nullable=True)
+
+    # Output of services.impact._validate_ai_payload
+    plan = Column(JSON, nullable=False)
+
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
+    last_used_at = Column(DateTime, server_default=func.now())
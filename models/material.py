@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -25,6 +25,11 @@ class Material(Base):
     image_uri = Column(String, nullable=True)
     original_image_uri = Column(String, nullable=True)
 
+    # Responsive derivatives ([{width, height, uri}]) and a blur-up data URI
+    image_variants = Column(JSON, nullable=True)
+    image_placeholder = Column(Text, nullable=True)
+    original_image_variants = Column(JSON, nullable=True)
+
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
 
     created_at = Column(DateTime, server_default=func.now())
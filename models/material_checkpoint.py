@@ -0,0 +1,19 @@
+import uuid
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class MaterialCheckpoint(Base):
+    __tablename__ = "material_checkpoints"
+    __table_args__ = (UniqueConstraint("material_id", "stage", name="uq_material_checkpoint_stage"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    material_id = Column(UUID(as_uuid=True), ForeignKey("materials.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Pipeline stage name (e.g. "description", "ways", "way:1:guide") and its JSON output
+    stage = Column(String, nullable=False)
+    payload = Column(JSON, nullable=True)
+
+    created_at = Column(DateTime, server_default=func.now())
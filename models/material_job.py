@@ -0,0 +1,30 @@
+import uuid
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class MaterialJob(Base):
+    __tablename__ = "material_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # One job row per material; re-enqueueing resets it
+    material_id = Column(UUID(as_uuid=True), ForeignKey("materials.id", ondelete="CASCADE"), nullable=False, unique=True)
+
+    # queued -> processing -> done | failed
+    status = Column(String, nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    last_error = Column(Text, nullable=True)
+
+    # Not claimable before this time (used for retry backoff)
+    run_after = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+
+    # Visibility timeout: a processing job whose lease expired is claimable again
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, JSON, Text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -25,6 +25,10 @@ class MaterialWay(Base):
 
     image_uri = Column(String, nullable=True)
 
+    # Responsive derivatives ([{width, height, uri}]) and a blur-up data URI
+    image_variants = Column(JSON, nullable=True)
+    image_placeholder = Column(Text, nullable=True)
+
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
@@ -0,0 +1,31 @@
+import uuid
+from sqlalchemy import Column, String, DateTime, Integer, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from core.database import Base
+
+
+class StorageTombstone(Base):
+    """
+    Outbox of R2 prefixes to delete. Rows are written in the same transaction
+    as the DB delete and removed by the storage collector once the prefix is empty.
+    """
+
+    __tablename__ = "storage_tombstones"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+
+    # Key prefix to empty, e.g. "materials/<id>/"
+    prefix = Column(String, nullable=False)
+
+    # Completed sweeps; a second one later catches objects uploaded by a
+    # pipeline job that was still running when the row was deleted
+    sweeps = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+
+    # Not claimable before this time (retry backoff and the re-sweep delay)
+    run_after = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    locked_until = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,68 @@
+from typing import Annotated
+from pydantic import AfterValidator, AliasChoices, BaseModel, Field, TypeAdapter, field_validator
+
+# Shapes Gemini is asked to produce (passed as response_schema) and that its
+# output is validated against. Over-long text is truncated rather than rejected.
+MAX_TITLE_LEN = 120
+MAX_DESC_LEN = 400
+MIN_STEPS = 1
+MAX_STEPS = 12
+WAYS_COUNT = 3
+
+
+def _clip(limit: int):
+    def clip(value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError("must not be empty")
+        return value[:limit]
+    return AfterValidator(clip)
+
+
+Title = Annotated[str, _clip(MAX_TITLE_LEN)]
+Description = Annotated[str, _clip(MAX_DESC_LEN)]
+
+
+class ImpactPlanStep(BaseModel):
+    title: Title
+    # Older prompts spelled it "descreption"; both are accepted
+    description: Description = Field(validation_alias=AliasChoices("description", "descreption"))
+    icon: Annotated[str, _clip(MAX_TITLE_LEN)] = Field(description="Font Awesome CSS class, e.g. fa-solid fa-recycle")
+
+
+class ImpactPlan(BaseModel):
+    title: Title
+    description: Description = Field(validation_alias=AliasChoices("description", "descreption"))
+    steps: list[ImpactPlanStep] = Field(min_length=MIN_STEPS, max_length=MAX_STEPS)
+
+    @field_validator("steps", mode="before")
+    @classmethod
+    def ordered_steps(cls, steps):
+        """Accept the legacy {"1": step, "2": step} shape; keys must run 1..n."""
+        if not isinstance(steps, dict):
+            return steps
+        try:
+            orders = [int(str(key).strip()) for key in steps]
+        except ValueError:
+            raise ValueError("Step keys must be numeric")
+        if sorted(orders) != list(range(1, len(orders) + 1)):
+            raise ValueError("Step order must start at 1 and be sequential")
+        return [step for _, step in sorted(zip(orders, steps.values()), key=lambda item: item[0])]
+
+
+class WaySuggestion(BaseModel):
+    title: Title
+    description: Annotated[str, _clip(2000)]
+    img_prompt: Annotated[str, _clip(2000)]
+
+
+class MaterialAnalysis(BaseModel):
+    """Description and way suggestions from a single multimodal call."""
+
+    description: Annotated[str, _clip(4000)]
+    ways: list[WaySuggestion] = Field(min_length=WAYS_COUNT, max_length=WAYS_COUNT)
+
+
+# Exactly WAYS_COUNT items, so the response schema carries minItems/maxItems too
+WaySuggestionList = Annotated[list[WaySuggestion], Field(min_length=WAYS_COUNT, max_length=WAYS_COUNT)]
+WaySuggestions = TypeAdapter(WaySuggestionList)
@@ -12,12 +12,19 @@ class MaterialCreate(MaterialBase):
 class MaterialUpdate(BaseModel):
     title: str = Field(..., min_length=2, max_length=100)
 
+class ImageVariant(BaseModel):
+    width: int
+    height: int
+    uri: str
+
 class MaterialWayResponse(BaseModel):
     id: UUID
     title: str
     description: str
     md: str
     image_uri: Optional[str] = Field(None, description="Public URL of the generated cover image")
+    image_variants: Optional[List[ImageVariant]] = Field(None, description="Smaller copies of the cover, by width")
+    image_placeholder: Optional[str] = Field(None, description="Tiny data URI of the cover to blur while loading")
     owner_id: UUID
     created_at: datetime
     
@@ -29,7 +36,10 @@ class MaterialResponse(MaterialBase):
     status: str
     error_message: Optional[str] = None
     image_uri: Optional[str] = Field(None, description="Public URL of the generated cover image")
+    image_variants: Optional[List[ImageVariant]] = Field(None, description="Smaller copies of the cover, by width")
+    image_placeholder: Optional[str] = Field(None, description="Tiny data URI of the cover to blur while loading")
     original_image_uri: Optional[str] = Field(None, description="Public URL of the original upload")
+    original_image_variants: Optional[List[ImageVariant]] = Field(None, description="Smaller copies of the original, by width")
     owner_id: UUID
     created_at: datetime
     ways: List[MaterialWayResponse] = []
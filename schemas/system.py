@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel
 
 
@@ -8,3 +9,36 @@ class RateLimitInfo(BaseModel):
 
 class LimitsResponse(BaseModel):
     rate_limits: RateLimitInfo
+
+
+class QueueStatsResponse(BaseModel):
+    queue_depth: int
+    processing_jobs: int
+    workers: int
+    max_in_flight_per_worker: int
+    active_jobs: int
+    jobs_processed: int
+    jobs_failed: int
+    last_job_seconds: Optional[float] = None
+    avg_job_seconds: Optional[float] = None
+
+
+class CounterMetric(BaseModel):
+    name: str
+    labels: dict[str, str]
+    value: float
+
+
+class HistogramMetric(BaseModel):
+    name: str
+    labels: dict[str, str]
+    count: int
+    sum: float
+    avg: Optional[float] = None
+    max: float
+    buckets: dict[str, int]
+
+
+class MetricsResponse(BaseModel):
+    counters: list[CounterMetric]
+    histograms: list[HistogramMetric]
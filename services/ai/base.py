@@ -1,74 +1,223 @@
-import json
 import logging
-from typing import Any, Optional
+import time
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar
 from google import genai
+from google.genai import types
 from core.config import settings
+from core.metrics import metrics
+from services.ai.cache import CacheValue, request_key, response_cache
+from services.ai.json_extract import extract_json
+from services.ai.limiter import gemini_limiter
+from services.ai.resilience import gemini_breaker, gemini_hedger
+from services.ai.singleflight import gemini_singleflight
+from services.ai.transport import GeminiTransport, build_transport
 from fastapi import HTTPException, status
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 class BaseGeminiClient:
     def __init__(self):
         self.api_key = settings.GOOGLE_API_KEY
         self.client = None
         if self.api_key:
             try:
-                self.client = genai.Client(api_key=self.api_key)
+                self.client = genai.Client(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(timeout=settings.GEMINI_REQUEST_TIMEOUT_SECONDS * 1000),
+                )
             except Exception:
                 logger.exception("Failed to initialize Google GenAI client")
+        # Live SDK by default; record/replay/fake via GEMINI_TRANSPORT
+        self.transport = build_transport(self.client)
 
-    def _get_client(self) -> genai.Client:
-        if not self.client:
+    def _get_transport(self) -> GeminiTransport:
+        if not self.transport:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail={"code": "ai_unavailable", "message": "AI service not configured or unavailable"},
             )
-        return self.client
+        return self.transport
 
-    def _extract_json(self, text: str) -> Any:
-        if not text:
-            raise ValueError("Empty AI response")
-        
-        cleaned = text.strip()
-        # Handle markdown code blocks
-        if "```" in cleaned:
-            # Try to find json block
-            import re
-            match = re.search(r"```json\s*(.*?)\s*```", cleaned, re.DOTALL)
-            if match:
-                cleaned = match.group(1)
-            else:
-                # Fallback to general code block
-                match = re.search(r"```\s*(.*?)\s*```", cleaned, re.DOTALL)
-                if match:
-                    cleaned = match.group(1)
-        
-        # Further cleanup: sometimes models add trailing commas or other junk
-        cleaned = cleaned.strip()
-        
+    def _generate(self, method: str, model: str, contents: Any, config: Any = None) -> Any:
+        """
+        Single choke point for blocking generate_content calls: guarded by the
+        per-model circuit breaker, hedged for opted-in methods, and each attempt
+        bounded by the shared per-model limiter and timed per method and model.
+        """
+        transport = self._get_transport()
+
+        def attempt():
+            with gemini_limiter.slot(model):
+                with metrics.timer("gemini_call_seconds", {"method": method, "model": model}):
+                    return transport.generate(model, contents, config)
+
+        with gemini_breaker.guard(model):
+            return gemini_hedger.call(method, model, attempt)
+
+    async def _generate_async(self, method: str, model: str, contents: Any, config: Any = None) -> Any:
+        """Async twin of _generate on the SDK's aio surface; holds no thread while waiting."""
+        transport = self._get_transport()
+
+        async def attempt():
+            async with gemini_limiter.slot_async(model):
+                with metrics.timer("gemini_call_seconds", {"method": method, "model": model}):
+                    return await transport.generate_async(model, contents, config)
+
+        with gemini_breaker.guard(model):
+            return await gemini_hedger.call_async(method, model, attempt)
+
+    async def _generate_stream_async(self, method: str, model: str, contents: Any, config: Any = None) -> AsyncIterator[str]:
+        """Streamed generation yielding text chunks; the limiter slot is held until the stream ends."""
+        transport = self._get_transport()
+        labels = {"method": method, "model": model}
+        with gemini_breaker.guard(model):
+            async with gemini_limiter.slot_async(model):
+                with metrics.timer("gemini_call_seconds", labels):
+                    started = time.perf_counter()
+                    first = True
+                    async for chunk in transport.generate_stream_async(model, contents, config):
+                        text = chunk.text
+                        if not text:
+                            continue
+                        if first:
+                            metrics.observe("gemini_first_chunk_seconds", time.perf_counter() - started, labels)
+                            first = False
+                        yield text
+
+    def _embed(self, method: str, model: str, text: str, config: Any = None) -> list[float]:
+        """Embed one text through the same breaker, hedging, limiter and metrics as generation."""
+        transport = self._get_transport()
+
+        def attempt():
+            with gemini_limiter.slot(model):
+                with metrics.timer("gemini_call_seconds", {"method": method, "model": model}):
+                    return transport.embed(model, text, config)
+
+        with gemini_breaker.guard(model):
+            response = gemini_hedger.call(method, model, attempt)
+        return list(response.embeddings[0].values)
+
+    def _cacheable(self, method: str) -> bool:
+        """Caching is opt-in per method via GEMINI_CACHE_METHODS."""
+        return settings.GEMINI_CACHE_ENABLED and method in settings.GEMINI_CACHE_METHODS
+
+    def _request_key(self, method: str, model: str, contents: Any, config: Any) -> Optional[str]:
+        """Shared by the response cache and single-flight; None when neither applies."""
+        if not self._cacheable(method) and not settings.GEMINI_SINGLEFLIGHT_ENABLED:
+            return None
+        return request_key(model, contents, config)
+
+    def _parse_cached(self, method: str, parse: Callable[[CacheValue], T], cached: Optional[CacheValue]):
+        """Returns (hit, parsed value, stale); stale entries no longer parse and should be dropped."""
+        if cached is None:
+            metrics.inc("gemini_cache_misses", {"method": method})
+            return False, None, False
         try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
-            # Last ditch effort: find the first { and last }
-            start = cleaned.find("{")
-            end = cleaned.rfind("}")
-            if start != -1 and end != -1:
-                try:
-                    return json.loads(cleaned[start:end+1])
-                except json.JSONDecodeError:
-                    pass
-            
-            # Or first [ and last ]
-            start = cleaned.find("[")
-            end = cleaned.rfind("]")
-            if start != -1 and end != -1:
-                try:
-                    return json.loads(cleaned[start:end+1])
-                except json.JSONDecodeError:
-                    pass
-                    
-            logger.error(f"Failed to parse JSON from AI response: {text}")
-            raise ValueError("Could not extract valid JSON from AI response")
+            value = parse(cached)
+        except Exception as e:
+            logger.warning(f"Discarding cached {method} result that failed to parse: {e}")
+            return False, None, True
+        metrics.inc("gemini_cache_hits", {"method": method})
+        return True, value, False
+
+    def _cache_lookup(self, key: Optional[str], method: str, parse: Callable[[CacheValue], T], fresh: bool):
+        """Returns (hit, parsed value). Entries that no longer parse are dropped."""
+        if key is None or fresh or not self._cacheable(method):
+            return False, None
+        hit, value, stale = self._parse_cached(method, parse, response_cache.get(key))
+        if stale:
+            response_cache.discard(key)
+        return hit, value
+
+    async def _cache_lookup_async(self, key: Optional[str], method: str, parse: Callable[[CacheValue], T], fresh: bool):
+        """_cache_lookup with the disk tier read off the event loop."""
+        if key is None or fresh or not self._cacheable(method):
+            return False, None
+        hit, value, stale = self._parse_cached(method, parse, await response_cache.get_async(key))
+        if stale:
+            await response_cache.discard_async(key)
+        return hit, value
+
+    def _flight_key(self, key: Optional[str], method: str, fresh: bool) -> Optional[str]:
+        if key is None or not settings.GEMINI_SINGLEFLIGHT_ENABLED:
+            return None
+        # Fresh retries must not join a call that may be producing the bad output
+        return f"{method}:{key}:fresh" if fresh else f"{method}:{key}"
+
+    def _generate_cached(
+        self,
+        method: str,
+        model: str,
+        contents: Any,
+        config: Any = None,
+        extract: Optional[Callable[[Any], CacheValue]] = None,
+        parse: Callable[[CacheValue], T] = lambda value: value,
+        fresh: bool = False,
+        key_contents: Any = None,
+    ) -> T:
+        """
+        _generate through the response cache and single-flight. `extract` turns
+        the SDK response into the cached value (text by default); `parse` is
+        applied to both hits and fresh results, and only values that parse are
+        stored. `fresh` skips the lookup but still refreshes the entry (used
+        when retrying bad output). `key_contents` stands in for `contents` when
+        keying, e.g. to identify an uploaded file by digest rather than URI.
+        Concurrent identical calls share one request.
+        """
+        extract = extract or self._response_to_text
+        key = self._request_key(method, model, contents if key_contents is None else key_contents, config)
+        hit, value = self._cache_lookup(key, method, parse, fresh)
+        if hit:
+            return value
+
+        def call() -> CacheValue:
+            return extract(self._generate(method, model, contents, config))
+
+        flight_key = self._flight_key(key, method, fresh)
+        if flight_key:
+            result, shared = gemini_singleflight.do(flight_key, call, {"method": method})
+        else:
+            result, shared = call(), False
+        value = parse(result)
+        if self._cacheable(method) and not shared:
+            response_cache.set(key, result)
+        return value
+
+    async def _generate_cached_async(
+        self,
+        method: str,
+        model: str,
+        contents: Any,
+        config: Any = None,
+        extract: Optional[Callable[[Any], CacheValue]] = None,
+        parse: Callable[[CacheValue], T] = lambda value: value,
+        fresh: bool = False,
+        key_contents: Any = None,
+    ) -> T:
+        """Async twin of _generate_cached; cache disk I/O runs on a worker thread."""
+        extract = extract or self._response_to_text
+        key = self._request_key(method, model, contents if key_contents is None else key_contents, config)
+        hit, value = await self._cache_lookup_async(key, method, parse, fresh)
+        if hit:
+            return value
+
+        async def call() -> CacheValue:
+            return extract(await self._generate_async(method, model, contents, config))
+
+        flight_key = self._flight_key(key, method, fresh)
+        if flight_key:
+            result, shared = await gemini_singleflight.do_async(flight_key, call, {"method": method})
+        else:
+            result, shared = await call(), False
+        value = parse(result)
+        if self._cacheable(method) and not shared:
+            await response_cache.set_async(key, result)
+        return value
+
+    def _extract_json(self, text: str) -> Any:
+        return extract_json(text)
 
     def _response_to_text(self, response: Any) -> str:
         if response is None:
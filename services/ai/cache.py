@@ -0,0 +1,216 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Union
+from pydantic import BaseModel
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CacheValue = Union[str, bytes]
+
+
+def _canonical(value: Any) -> Any:
+    """JSON-safe form of a request; binary payloads are replaced by their digest."""
+    if isinstance(value, (bytes, bytearray)):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, BaseModel):
+        return _canonical(value.model_dump(exclude_none=True))
+    if isinstance(value, type) and issubclass(value, BaseModel):
+        return _canonical(value.model_json_schema())
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def request_key(model: str, contents: Any, config: Any = None) -> str:
+    """Content-addressed key: hash of model, prompt/parts, config and attached bytes."""
+    canonical = json.dumps(
+        {"model": model, "contents": _canonical(contents), "config": _canonical(config)},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of Gemini results (text or raw image bytes).
+    An in-memory LRU with TTL, plus an optional on-disk tier that survives
+    restarts and is shared by processes on the same host. The *_async
+    variants do disk I/O on a worker thread, and expired files are pruned
+    by a background thread, so callers on the event loop never touch disk.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, max_entries: int, ttl_seconds: int, max_entry_bytes: int, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_dir = disk_dir
+        self._memory: "OrderedDict[str, tuple[float, CacheValue]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._pruning = False
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _get_memory(self, key: str, now: float) -> Optional[CacheValue]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+        return None
+
+    def _get_disk(self, key: str, now: float) -> Optional[CacheValue]:
+        value = self._read_disk(key, now)
+        if value is not None:
+            self._remember(key, value, now + self.ttl_seconds)
+        return value
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self.disk_dir:
+            value = self._get_disk(key, now)
+        return value
+
+    async def get_async(self, key: str) -> Optional[CacheValue]:
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self.disk_dir:
+            value = await asyncio.to_thread(self._get_disk, key, now)
+        return value
+
+    def _admit(self, key: str, value: CacheValue) -> Optional[float]:
+        """Store in memory; returns the expiry, or None when the value is too large to cache."""
+        size = len(value.encode() if isinstance(value, str) else value)
+        if size > self.max_entry_bytes:
+            return None
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        return expires_at
+
+    def set(self, key: str, value: CacheValue):
+        expires_at = self._admit(key, value)
+        if expires_at is not None and self.disk_dir:
+            self._write_disk(key, value, expires_at)
+
+    async def set_async(self, key: str, value: CacheValue):
+        expires_at = self._admit(key, value)
+        if expires_at is not None and self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value, expires_at)
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def discard(self, key: str):
+        self._forget(key)
+        if self.disk_dir:
+            self._remove(self._path(key))
+
+    async def discard_async(self, key: str):
+        self._forget(key)
+        if self.disk_dir:
+            await asyncio.to_thread(self._remove, self._path(key))
+
+    def _remember(self, key: str, value: CacheValue, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    # File layout: one JSON header line ({"expires_at", "kind"}) followed by the raw value
+    def _read_disk(self, key: str, now: float) -> Optional[CacheValue]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header["expires_at"] <= now:
+                    raise FileNotFoundError
+                data = f.read()
+        except FileNotFoundError:
+            self._remove(path)
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable cache entry {key}: {e}")
+            self._remove(path)
+            return None
+        return data.decode() if header.get("kind") == "text" else data
+
+    def _write_disk(self, key: str, value: CacheValue, expires_at: float):
+        path = self._path(key)
+        kind = "text" if isinstance(value, str) else "bytes"
+        data = value.encode() if isinstance(value, str) else value
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps({"expires_at": expires_at, "kind": kind}).encode() + b"\n")
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key}: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % self.PRUNE_EVERY == 0 and not self._pruning
+            if should_prune:
+                self._pruning = True
+        if should_prune:
+            # Walking the whole directory is slow; never do it on the write path
+            threading.Thread(target=self._prune_in_background, daemon=True, name="GeminiCachePrune").start()
+
+    def _prune_in_background(self):
+        try:
+            self.prune()
+        except Exception as e:
+            logger.warning(f"Pruning the response cache failed: {e}")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        """Delete expired entries from the disk tier."""
+        now = time.time()
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    with open(path, "rb") as f:
+                        if json.loads(f.readline())["expires_at"] <= now:
+                            self._remove(path)
+                except (OSError, ValueError, KeyError):
+                    continue
+
+
+response_cache = ResponseCache(
+    max_entries=settings.GEMINI_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.GEMINI_CACHE_TTL_SECONDS,
+    max_entry_bytes=settings.GEMINI_CACHE_MAX_ENTRY_BYTES,
+    disk_dir=settings.GEMINI_CACHE_DIR or None,
+)
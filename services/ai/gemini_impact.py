@@ -1,7 +1,9 @@
 import logging
-from typing import Tuple
+from typing import AsyncIterator, Tuple
+from google.genai import types
 from core.config import settings
 from models import User
+from schemas.ai import ImpactPlan
 from services.ai.base import BaseGeminiClient
 
 logger = logging.getLogger(__name__)
@@ -10,9 +12,9 @@ class GeminiImpactClient(BaseGeminiClient):
     def __init__(self):
         super().__init__()
         self.model = settings.IMPACT_GENERATION_MODEL
+        self.embedding_model = settings.IMPACT_EMBEDDING_MODEL
 
-    def generate_impact_payload(self, topic: str, user: User) -> Tuple[dict, str]:
-        client = self._get_client()
+    def _impact_prompt(self, topic: str, user: User) -> str:
         user_name = user.full_name
         user_age = user.age
         user_interests = ", ".join(user.interests or [])
@@ -22,14 +24,14 @@ You are a sustainability expert, totur, you will help the user optimize and make
 You are generating a structured plan in JSON. Output ONLY valid JSON with this exact shape:
 {{
   "title": "impact title",
-  "descreption": "impact short descreption",
-  "steps": {{
-    "1": {{
+  "description": "impact short description",
+  "steps": [
+    {{
       "title": "step title",
-      "descreption": "step full blown descreption",
+      "description": "step full blown description",
       "icon": "fa-solid fa-recycle"
     }}
-  }}
+  ]
 }}
 
 User input Topic: {topic}
@@ -46,13 +48,47 @@ Tone rules:
 - Tailor explanations to the user's age and interests so guidance is easy to understand.
 - This session is private and has zero logging; do not state otherwise.
 """
-        response = client.models.generate_content(
-            model=self.model,
-            contents=prompt,
-            config={"response_mime_type": "application/json"},
-        )
-        
-        text = self._response_to_text(response)
+        return prompt
+
+    def _impact_config(self) -> types.GenerateContentConfig:
+        # Constrained decoding to the plan shape, so output rarely fails validation
+        return types.GenerateContentConfig(response_mime_type="application/json", response_schema=ImpactPlan)
+
+    def _parse_payload(self, text: str) -> Tuple[dict, str]:
         return self._extract_json(text), text
 
+    def generate_impact_payload(self, topic: str, user: User, fresh: bool = False) -> Tuple[dict, str]:
+        return self._generate_cached(
+            "generate_impact_payload",
+            self.model,
+            contents=self._impact_prompt(topic, user),
+            config=self._impact_config(),
+            parse=self._parse_payload,
+            fresh=fresh,
+        )
+
+    async def generate_impact_payload_async(self, topic: str, user: User, fresh: bool = False) -> Tuple[dict, str]:
+        return await self._generate_cached_async(
+            "generate_impact_payload",
+            self.model,
+            contents=self._impact_prompt(topic, user),
+            config=self._impact_config(),
+            parse=self._parse_payload,
+            fresh=fresh,
+        )
+
+    def stream_impact_payload(self, topic: str, user: User) -> AsyncIterator[str]:
+        """Raw JSON text chunks of the plan as Gemini produces them."""
+        return self._generate_stream_async(
+            "stream_impact_payload",
+            self.model,
+            contents=self._impact_prompt(topic, user),
+            config=self._impact_config(),
+        )
+
+    def embed_topic(self, topic: str) -> list[float]:
+        # Short topics don't need the full 3072 dimensions; smaller vectors keep lookups cheap
+        config = types.EmbedContentConfig(output_dimensionality=settings.IMPACT_EMBEDDING_DIMENSIONS)
+        return self._embed("embed_topic", self.embedding_model, topic, config)
+
 gemini_impact = GeminiImpactClient()
@@ -1,43 +1,108 @@
-import base64
-import io
+import hashlib
 import logging
-from PIL import Image
+from dataclasses import dataclass, replace
+from typing import Optional
 from google.genai import types
 from core.config import settings
+from core.metrics import metrics
+from schemas.ai import WAYS_COUNT, MaterialAnalysis, WaySuggestions
 from services.ai.base import BaseGeminiClient
+from services.image_processing import EncodedImage, image_pool, process_generated_image
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class ReferenceImage:
+    """
+    The material photo as sent to Gemini: a Files API URI when it was uploaded
+    once for the job, otherwise inline bytes. Cache keys use the content
+    digest, so both forms (and every upload of the same image) share entries.
+    """
+
+    mime_type: str
+    digest: str
+    data: Optional[bytes] = None
+    uri: Optional[str] = None
+    name: Optional[str] = None
+
+    @classmethod
+    def inline(cls, data: bytes, mime_type: str) -> "ReferenceImage":
+        return cls(mime_type=mime_type, digest=hashlib.sha256(data).hexdigest(), data=data)
+
+    def part(self) -> types.Part:
+        if self.uri:
+            return types.Part.from_uri(file_uri=self.uri, mime_type=self.mime_type)
+        return types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+
+    def cache_token(self) -> dict:
+        return {"reference_sha256": self.digest, "mime_type": self.mime_type}
+
+
 class GeminiMaterialClient(BaseGeminiClient):
     def __init__(self):
         super().__init__()
         self.text_model = settings.MATERIAL_TEXT_GENERATION_MODEL
         self.img_model = settings.MATERIAL_IMG_GENERATION_MODEL
 
-    def describe_material(self, image_bytes: bytes, mime_type: str) -> str:
-        client = self._get_client()
+    def upload_reference(self, data: bytes, mime_type: str, display_name: str) -> ReferenceImage:
+        """
+        Upload the job's reference image once so later calls send only its URI.
+        Falls back to inline bytes when the Files API is disabled, unsupported
+        by the transport (record/replay/fake) or the upload fails.
+        """
+        reference = ReferenceImage.inline(data, mime_type)
+        transport = self.transport
+        if not settings.GEMINI_FILES_API_ENABLED or transport is None or not transport.supports_files:
+            return reference
+        try:
+            with metrics.timer("gemini_call_seconds", {"method": "upload_reference", "model": "files"}):
+                uploaded = transport.upload_file(data, mime_type, display_name)
+        except Exception as e:
+            logger.warning(f"Reference upload failed, sending the image inline: {e}")
+            return reference
+        return replace(reference, uri=uploaded.uri, name=uploaded.name)
+
+    def release_reference(self, reference: ReferenceImage):
+        """Delete an uploaded reference. Never raises; the Files API expires it anyway."""
+        if not reference.name or self.transport is None:
+            return
+        try:
+            self.transport.delete_file(reference.name)
+        except Exception as e:
+            logger.warning(f"Failed to delete uploaded reference {reference.name}: {e}")
+
+    # Each generation is split into a request builder shared by the sync and
+    # async variants, so prompts live in exactly one place.
+
+    def _describe_request(self, reference: ReferenceImage) -> dict:
         prompt = (
             "Analyze this image. Provide a REALISTIC description of the main waste material/object shown. "
             "Focus on its condition, material type (plastic, wood, etc.), and distinct features. "
             "Keep the description CONCISE: 2-3 short paragraphs max. Avoid flowery or overly poetic language."
         )
         
-        response = client.models.generate_content(
-            model=self.text_model,
+        return dict(
             contents=[
                 types.Content(
                     parts=[
-                        types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                        reference.part(),
                         types.Part.from_text(text=prompt)
                     ]
                 )
-            ]
+            ],
+            key_contents=[reference.cache_token(), prompt],
         )
-        return self._response_to_text(response)
 
-    def generate_ways_json(self, image_bytes: bytes, mime_type: str, description: str) -> list:
-        client = self._get_client()
-        
+    def describe_material(self, reference: ReferenceImage) -> str:
+        return self._generate_cached("describe_material", self.text_model, **self._describe_request(reference))
+
+    async def describe_material_async(self, reference: ReferenceImage) -> str:
+        return await self._generate_cached_async(
+            "describe_material", self.text_model, **self._describe_request(reference)
+        )
+
+    def _ways_request(self, reference: ReferenceImage, description: str) -> dict:
         prompt = f"""
         Context: The user wants to upcycle/recycle this material.
         Description of material: {description}
@@ -58,26 +123,98 @@ class GeminiMaterialClient(BaseGeminiClient):
         Do not include markdown code fences. Just the raw JSON array.
         """
 
-        response = client.models.generate_content(
-            model=self.text_model,
+        return dict(
             contents=[
                 types.Content(
                     parts=[
-                        types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                        reference.part(),
                         types.Part.from_text(text=prompt)
                     ]
                 )
             ],
+            key_contents=[reference.cache_token(), prompt],
             config=types.GenerateContentConfig(
-                response_mime_type="application/json"
+                response_mime_type="application/json",
+                # JSON Schema rather than a type: the SDK can't convert an Annotated
+                # list, and minItems/maxItems must reach the model
+                response_json_schema=WaySuggestions.json_schema(),
             )
         )
-        
-        text = self._response_to_text(response)
-        return self._extract_json(text)
 
-    def generate_step_guide(self, user_img: bytes, mime: str, mat_title: str, mat_desc: str, way_title: str, way_desc: str) -> str:
-        client = self._get_client()
+    def _parse_ways(self, text: str) -> list[dict]:
+        return [way.model_dump() for way in WaySuggestions.validate_python(self._extract_json(text))]
+
+    def generate_ways_json(self, reference: ReferenceImage, description: str) -> list:
+        return self._generate_cached(
+            "generate_ways_json",
+            self.text_model,
+            **self._ways_request(reference, description),
+            parse=self._parse_ways,
+        )
+
+    async def generate_ways_json_async(self, reference: ReferenceImage, description: str) -> list:
+        return await self._generate_cached_async(
+            "generate_ways_json",
+            self.text_model,
+            **self._ways_request(reference, description),
+            parse=self._parse_ways,
+        )
+
+    def _analysis_request(self, reference: ReferenceImage) -> dict:
+        # Describe + ways in one round trip; same instructions as the two separate prompts
+        prompt = (
+            "Analyze this image of a waste material/object and the user wants to upcycle/recycle it.\n\n"
+            "1. description: a REALISTIC description of the main material/object shown. Focus on its condition, "
+            "material type (plastic, wood, etc.), and distinct features. Keep it CONCISE: 2-3 short paragraphs max. "
+            "Avoid flowery or overly poetic language.\n"
+            f"2. ways: EXACTLY {WAYS_COUNT} REALISTIC, FEASIBLE, and USEFUL ways to recycle this material into "
+            "something new at home. Avoid purely decorative \"art\" unless it serves a function. Focus on practical "
+            "utility. Each way has a title, a description, and an img_prompt (a realistic photo prompt of the "
+            "finished project made from this material).\n\n"
+            "Output strict JSON matching the schema."
+        )
+
+        return dict(
+            contents=[
+                types.Content(
+                    parts=[
+                        reference.part(),
+                        types.Part.from_text(text=prompt)
+                    ]
+                )
+            ],
+            key_contents=[reference.cache_token(), prompt],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=MaterialAnalysis,
+            )
+        )
+
+    def _parse_analysis(self, text: str) -> dict:
+        analysis = MaterialAnalysis.model_validate(self._extract_json(text))
+        return {
+            "description": analysis.description,
+            "ways": [way.model_dump() for way in analysis.ways],
+        }
+
+    def analyze_material(self, reference: ReferenceImage) -> dict:
+        """Description and ways together: {"description": str, "ways": [{title, description, img_prompt}]}."""
+        return self._generate_cached(
+            "analyze_material",
+            self.text_model,
+            **self._analysis_request(reference),
+            parse=self._parse_analysis,
+        )
+
+    async def analyze_material_async(self, reference: ReferenceImage) -> dict:
+        return await self._generate_cached_async(
+            "analyze_material",
+            self.text_model,
+            **self._analysis_request(reference),
+            parse=self._parse_analysis,
+        )
+
+    def _step_guide_request(self, reference: ReferenceImage, mat_title: str, mat_desc: str, way_title: str, way_desc: str) -> dict:
         prompt = f"""
         Material: {mat_title}
         Material Description: {mat_desc}
@@ -97,56 +234,80 @@ class GeminiMaterialClient(BaseGeminiClient):
         Make it look professional, encouraging, and easy to follow.
         """
         
-        response = client.models.generate_content(
-            model=self.text_model,
+        return dict(
             contents=[
                 types.Content(
                     parts=[
-                        types.Part.from_bytes(data=user_img, mime_type=mime),
+                        reference.part(),
                         types.Part.from_text(text=prompt)
                     ]
                 )
-            ]
+            ],
+            key_contents=[reference.cache_token(), prompt],
         )
-        return self._response_to_text(response)
 
-    def generate_image(self, prompt: str, reference_image: bytes = None, mime_type: str = "image/png") -> bytes:
-        client = self._get_client()
-        
+    def generate_step_guide(self, reference: ReferenceImage, mat_title: str, mat_desc: str, way_title: str, way_desc: str) -> str:
+        request = self._step_guide_request(reference, mat_title, mat_desc, way_title, way_desc)
+        return self._generate_cached("generate_step_guide", self.text_model, **request)
+
+    async def generate_step_guide_async(self, reference: ReferenceImage, mat_title: str, mat_desc: str, way_title: str, way_desc: str) -> str:
+        request = self._step_guide_request(reference, mat_title, mat_desc, way_title, way_desc)
+        return await self._generate_cached_async("generate_step_guide", self.text_model, **request)
+
+    def _image_request(self, prompt: str, reference: Optional[ReferenceImage] = None) -> dict:
         contents = []
-        if reference_image:
+        if reference:
             contents.append(types.Content(parts=[
                 types.Part.from_text(text=prompt),
-                types.Part.from_bytes(data=reference_image, mime_type=mime_type)
+                reference.part()
             ]))
         else:
             contents.append(types.Content(parts=[types.Part.from_text(text=prompt)]))
 
-        response = client.models.generate_content(
-            model=self.img_model,
+        return dict(
             contents=contents,
             config=types.GenerateContentConfig(
                 response_modalities=["IMAGE"],
                 image_config=types.ImageConfig(
                     aspect_ratio="16:9"
                 )
-            )
+            ),
+            key_contents=[prompt, reference.cache_token() if reference else None],
         )
-        
+
+    def _image_data_from_response(self, response) -> bytes:
+        # The raw generated image is what gets cached; post-processing reruns on hits
         for part in response.parts:
             if part.inline_data:
-                try:
-                    img = Image.open(io.BytesIO(part.inline_data.data))
-                except Exception:
-                    decoded = base64.b64decode(part.inline_data.data)
-                    img = Image.open(io.BytesIO(decoded))
-                
-                img = img.resize((500, 300), Image.Resampling.LANCZOS)
-                
-                buf = io.BytesIO()
-                img.save(buf, format="PNG")
-                return buf.getvalue()
-        
+                return part.inline_data.data
+
         raise Exception("No image generated")
 
+    def _process_args(self, data: bytes) -> tuple:
+        return (
+            data,
+            settings.GENERATED_IMAGE_MAX_WIDTH,
+            settings.GENERATED_IMAGE_MAX_HEIGHT,
+            settings.GENERATED_IMAGE_FORMAT,
+            settings.GENERATED_IMAGE_QUALITY,
+        )
+
+    def generate_image(self, prompt: str, reference: Optional[ReferenceImage] = None) -> EncodedImage:
+        data = self._generate_cached(
+            "generate_image",
+            self.img_model,
+            **self._image_request(prompt, reference),
+            extract=self._image_data_from_response,
+        )
+        return image_pool.run(process_generated_image, *self._process_args(data))
+
+    async def generate_image_async(self, prompt: str, reference: Optional[ReferenceImage] = None) -> EncodedImage:
+        data = await self._generate_cached_async(
+            "generate_image",
+            self.img_model,
+            **self._image_request(prompt, reference),
+            extract=self._image_data_from_response,
+        )
+        return await image_pool.run_async(process_generated_image, *self._process_args(data))
+
 gemini_material = GeminiMaterialClient()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import json
+import logging
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_decoder = json.JSONDecoder()
+_OPENERS = "{["
+PREVIEW_CHARS = 500
+
+
+def _next_opener(text: str, start: int) -> int:
+    brace = text.find("{", start)
+    bracket = text.find("[", start)
+    if brace == -1:
+        return bracket
+    if bracket == -1:
+        return brace
+    return min(brace, bracket)
+
+
+def _ends_inside(text: str, error: json.JSONDecodeError) -> bool:
+    """Whether decoding failed because the input ran out, not because of bad syntax."""
+    if error.msg.startswith("Unterminated string"):
+        # The scanner only reports this once it reaches the end of the input
+        return True
+    return error.pos >= len(text.rstrip())
+
+
+def extract_json(text: str) -> Any:
+    """
+    Return the outermost JSON object/array in a model response.
+
+    Handles code fences, prose before the value and junk after it in one
+    left-to-right pass: each { or [ is decoded in place with the C scanner
+    (which tracks string and escape state), a decoded value is skipped as a
+    whole, and the longest value wins. So "see [1]" in a preamble doesn't
+    shadow the real payload, and braces inside strings never confuse it.
+    A value cut off by the end of the response (truncated output) raises
+    rather than yielding one of its complete inner fragments.
+    """
+    if not text:
+        raise ValueError("Empty AI response")
+
+    stripped = text.strip()
+    if stripped[:1] in _OPENERS:
+        # Fast path: response_mime_type=application/json output is the value itself
+        try:
+            return json.loads(stripped)
+        except json.JSONDecodeError:
+            pass
+
+    best = None
+    best_len = 0
+    truncated = False
+    pos = _next_opener(text, 0)
+    while pos != -1:
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError as e:
+            if _ends_inside(text, e):
+                truncated = True
+                break
+            pos = _next_opener(text, pos + 1)
+            continue
+        if end - pos > best_len:
+            best, best_len = value, end - pos
+        pos = _next_opener(text, end)
+
+    if best_len and not truncated:
+        return best
+
+    preview = text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS] + "...(truncated)"
+    logger.error(f"Failed to parse JSON from AI response ({len(text)} chars): {preview}")
+    if truncated:
+        raise ValueError("AI response ended before the JSON value was complete")
+    raise ValueError("Could not extract valid JSON from AI response")
@@ -0,0 +1,110 @@
+import json
+from typing import Any, Optional, Union
+
+PathKey = Union[str, int]
+
+_WHITESPACE = " \t\r\n"
+
+
+class _Frame:
+    __slots__ = ("is_object", "path", "start", "key", "index", "expect_key", "value_start")
+
+    def __init__(self, is_object: bool, path: tuple, start: int):
+        self.is_object = is_object
+        self.path = path
+        self.start = start
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = is_object
+        self.value_start: Optional[int] = None
+
+    def child_key(self) -> PathKey:
+        return self.key if self.is_object else self.index
+
+
+class JsonStreamParser:
+    """
+    Incremental parser for a streamed JSON document.
+    feed() takes text chunks as they arrive and returns (path, value) pairs
+    for every value that completed at depth <= max_depth, e.g. ("title",)
+    or ("steps", "2"). Text before the first { or [ (such as a ```json fence)
+    and anything after the root value is ignored.
+    """
+
+    def __init__(self, max_depth: int = 2):
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.done = False
+        self.root: Any = None
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def feed(self, chunk: str) -> list[tuple[tuple, Any]]:
+        self.buffer += chunk
+        events: list[tuple[tuple, Any]] = []
+        buffer = self.buffer
+        i = self._pos
+        end = len(buffer)
+        while i < end and not self.done:
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._string_closed(i + 1, events)
+            elif not self._stack:
+                if c in "{[":
+                    self._stack.append(_Frame(c == "{", (), i))
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c in "{[":
+                parent = self._stack[-1]
+                self._stack.append(_Frame(c == "{", parent.path + (parent.child_key(),), i))
+            elif c in "}]":
+                self._close_scalar(i, events)
+                frame = self._stack.pop()
+                self._complete(frame.start, i + 1, frame.path, events)
+            elif c == ",":
+                self._close_scalar(i, events)
+                frame = self._stack[-1]
+                if frame.is_object:
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+            elif c == ":":
+                self._stack[-1].expect_key = False
+            elif c not in _WHITESPACE:
+                frame = self._stack[-1]
+                if frame.value_start is None:
+                    frame.value_start = i
+            i += 1
+        self._pos = i
+        return events
+
+    def _string_closed(self, end: int, events: list):
+        frame = self._stack[-1]
+        if frame.is_object and frame.expect_key:
+            frame.key = json.loads(self.buffer[self._string_start:end])
+        else:
+            self._complete(self._string_start, end, frame.path + (frame.child_key(),), events)
+
+    def _close_scalar(self, end: int, events: list):
+        frame = self._stack[-1]
+        if frame.value_start is not None:
+            start, frame.value_start = frame.value_start, None
+            self._complete(start, end, frame.path + (frame.child_key(),), events)
+
+    def _complete(self, start: int, end: int, path: tuple, events: list):
+        if not path and not self._stack:
+            self.root = json.loads(self.buffer[start:end])
+            self.done = True
+            return
+        if len(path) <= self.max_depth:
+            events.append((path, json.loads(self.buffer[start:end].strip())))
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+from core.config import settings
+from core.metrics import metrics
+
+
+class ConcurrencyLimiter:
+    """
+    Process-wide cap on in-flight Gemini calls per model, shared by worker
+    threads (sync calls) and event-loop tasks (async calls).
+    A released slot is handed straight to the oldest waiter, so sync and
+    async callers queue fairly in one FIFO per model.
+    """
+
+    def __init__(self, default_limit: int, per_model: dict[str, int]):
+        self.default_limit = default_limit
+        self.per_model = per_model
+        self._lock = threading.Lock()
+        self._active: dict[str, int] = {}
+        self._waiters: dict[str, deque] = {}
+
+    def limit_for(self, model: str) -> int:
+        return max(1, self.per_model.get(model, self.default_limit))
+
+    def _try_acquire(self, model: str) -> bool:
+        active = self._active.get(model, 0)
+        if active < self.limit_for(model) and not self._waiters.get(model):
+            self._active[model] = active + 1
+            return True
+        return False
+
+    def acquire(self, model: str):
+        with self._lock:
+            if self._try_acquire(model):
+                return
+            waiter = threading.Event()
+            self._waiters.setdefault(model, deque()).append(waiter)
+        started = time.perf_counter()
+        waiter.wait()
+        metrics.observe("gemini_limiter_wait_seconds", time.perf_counter() - started, {"model": model})
+
+    async def acquire_async(self, model: str):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire(model):
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.setdefault(model, deque()).append(waiter)
+        started = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiters = self._waiters.get(model)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                    raise
+            # The slot was already handed to us; pass it on
+            self.release(model)
+            raise
+        metrics.observe("gemini_limiter_wait_seconds", time.perf_counter() - started, {"model": model})
+
+    def release(self, model: str):
+        with self._lock:
+            waiters = self._waiters.get(model)
+            if not waiters:
+                self._active[model] = max(0, self._active.get(model, 0) - 1)
+                return
+            waiter = waiters.popleft()
+        # Hand the slot over without decrementing the active count
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(_resolve, future)
+
+    @contextmanager
+    def slot(self, model: str) -> Iterator[None]:
+        self.acquire(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    @asynccontextmanager
+    async def slot_async(self, model: str) -> AsyncIterator[None]:
+        await self.acquire_async(model)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+gemini_limiter = ConcurrencyLimiter(
+    default_limit=settings.GEMINI_MAX_CONCURRENCY,
+    per_model=settings.GEMINI_MODEL_CONCURRENCY,
+)
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+import httpx
+from fastapi import HTTPException, status
+from google.genai import errors
+from core.config import settings
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Errors that say Gemini is unhealthy (5xx, 429, timeouts, transport), not that the request was bad."""
+    if isinstance(exc, errors.ServerError):
+        return True
+    if isinstance(exc, errors.ClientError):
+        return exc.code == 429
+    return isinstance(exc, (httpx.TransportError, TimeoutError, asyncio.TimeoutError, ConnectionError))
+
+
+def _unavailable(message: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail={"code": "ai_unavailable", "message": message},
+    )
+
+
+class _Circuit:
+    __slots__ = ("state", "failures", "opened_at", "probing")
+
+    def __init__(self):
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+
+class CircuitBreaker:
+    """
+    Per-model breaker: after `failure_threshold` consecutive upstream failures
+    calls fail fast with 503 ai_unavailable for `reset_seconds`, then a single
+    probe is let through (half-open). Its success closes the circuit, its
+    failure re-opens it.
+    """
+
+    def __init__(self, enabled: bool, failure_threshold: int, reset_seconds: float):
+        self.enabled = enabled
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._circuits: dict[str, _Circuit] = {}
+
+    def _transition(self, model: str, circuit: _Circuit, state: str):
+        circuit.state = state
+        metrics.inc("gemini_breaker_transitions", {"model": model, "state": state})
+        logger.warning(f"Gemini circuit for {model} is now {state}")
+
+    def _before_call(self, model: str) -> bool:
+        """Returns whether this call is the half-open probe; raises while open."""
+        with self._lock:
+            circuit = self._circuits.setdefault(model, _Circuit())
+            if circuit.state == "closed":
+                return False
+            if circuit.state == "open" and time.monotonic() - circuit.opened_at >= self.reset_seconds:
+                self._transition(model, circuit, "half_open")
+            if circuit.state == "half_open" and not circuit.probing:
+                circuit.probing = True
+                return True
+        metrics.inc("gemini_breaker_rejections", {"model": model})
+        raise _unavailable("AI service temporarily unavailable")
+
+    def _after_call(self, model: str, probe: bool, failed: Optional[bool]):
+        """failed=None means the outcome says nothing about upstream health (e.g. cancelled)."""
+        with self._lock:
+            circuit = self._circuits[model]
+            if probe:
+                circuit.probing = False
+            if failed is None:
+                return
+            if not failed:
+                circuit.failures = 0
+                if circuit.state != "closed":
+                    self._transition(model, circuit, "closed")
+                return
+            circuit.failures += 1
+            if probe or (circuit.state == "closed" and circuit.failures >= self.failure_threshold):
+                circuit.opened_at = time.monotonic()
+                self._transition(model, circuit, "open")
+
+    @contextmanager
+    def guard(self, model: str) -> Iterator[None]:
+        """Wrap one logical call; upstream failures surface as 503 ai_unavailable."""
+        if not self.enabled:
+            yield
+            return
+        probe = self._before_call(model)
+        try:
+            yield
+        except HTTPException:
+            self._after_call(model, probe, None)
+            raise
+        except Exception as exc:
+            failed = is_upstream_failure(exc)
+            self._after_call(model, probe, failed)
+            if failed:
+                raise _unavailable("AI service error") from exc
+            raise
+        except BaseException:
+            self._after_call(model, probe, None)
+            raise
+        else:
+            self._after_call(model, probe, False)
+
+    def state(self, model: str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(model)
+            return circuit.state if circuit else "closed"
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per (method, model)."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: dict[tuple[str, str], deque] = {}
+
+    def record(self, method: str, model: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault((method, model), deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, method: str, model: str, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get((method, model), ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class Hedger:
+    """
+    Hedged requests for short calls: when the first attempt outlives the
+    method's latency percentile, a second identical attempt is sent and the
+    first success wins. Methods opt in via GEMINI_HEDGE_METHODS; no hedging
+    happens until enough latency samples exist. At most `max_in_flight`
+    hedges run at once; beyond that the hedge is skipped rather than queued,
+    so a slow upstream doesn't also get a backlog of duplicate requests.
+    """
+
+    def __init__(self, methods: list[str], percentile: float, min_samples: int, min_delay: float, max_in_flight: int):
+        self.methods = set(methods)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_in_flight = max(1, max_in_flight)
+        self.latencies = LatencyTracker()
+        self._hedge_slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _delay(self, method: str, model: str) -> Optional[float]:
+        if method not in self.methods:
+            return None
+        delay = self.latencies.percentile(method, model, self.percentile, self.min_samples)
+        return None if delay is None else max(delay, self.min_delay)
+
+    def _timed(self, method: str, model: str, attempt: Callable[[], T]) -> T:
+        started = time.perf_counter()
+        result = attempt()
+        self.latencies.record(method, model, time.perf_counter() - started)
+        return result
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Sized to the hedge slots, so an admitted hedge never waits for a worker
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="GeminiHedge")
+            return self._executor
+
+    def _admit_hedge(self, method: str) -> bool:
+        if self._hedge_slots.acquire(blocking=False):
+            metrics.inc("gemini_hedges_sent", {"method": method})
+            return True
+        metrics.inc("gemini_hedges_skipped", {"method": method})
+        return False
+
+    def _hedge(self, method: str, model: str, attempt: Callable[[], T]) -> T:
+        try:
+            return self._timed(method, model, attempt)
+        finally:
+            self._hedge_slots.release()
+
+    def _start_primary(self, method: str, model: str, attempt: Callable[[], T]) -> Future:
+        """
+        Run the primary on its own thread, outside the hedge pool, so it starts
+        at once and its latency is never inflated by queueing; the caller stays
+        free to return whichever attempt succeeds first.
+        """
+        future: Future = Future()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self._timed(method, model, attempt))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+        threading.Thread(target=run, daemon=True, name="GeminiPrimary").start()
+        return future
+
+    def call(self, method: str, model: str, attempt: Callable[[], T]) -> T:
+        delay = self._delay(method, model)
+        if delay is None:
+            return self._timed(method, model, attempt)
+
+        primary = self._start_primary(method, model, attempt)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._admit_hedge(method):
+            return primary.result()
+
+        hedge = self._pool().submit(self._hedge, method, model, attempt)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        metrics.inc("gemini_hedges_won", {"method": method})
+                    # The loser keeps running in the pool; its result is dropped
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def call_async(self, method: str, model: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        async def timed() -> T:
+            started = time.perf_counter()
+            result = await attempt()
+            self.latencies.record(method, model, time.perf_counter() - started)
+            return result
+
+        delay = self._delay(method, model)
+        if delay is None:
+            return await timed()
+
+        primary = asyncio.ensure_future(timed())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._admit_hedge(method):
+            return await primary
+
+        hedge = asyncio.ensure_future(timed())
+        # A callback, unlike try/finally, also runs if the task is cancelled before it starts
+        hedge.add_done_callback(lambda _: self._hedge_slots.release())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc("gemini_hedges_won", {"method": method})
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+gemini_breaker = CircuitBreaker(
+    enabled=settings.GEMINI_BREAKER_ENABLED,
+    failure_threshold=settings.GEMINI_BREAKER_FAILURE_THRESHOLD,
+    reset_seconds=settings.GEMINI_BREAKER_RESET_SECONDS,
+)
+
+gemini_hedger = Hedger(
+    methods=settings.GEMINI_HEDGE_METHODS,
+    percentile=settings.GEMINI_HEDGE_PERCENTILE,
+    min_samples=settings.GEMINI_HEDGE_MIN_SAMPLES,
+    min_delay=settings.GEMINI_HEDGE_MIN_DELAY_SECONDS,
+    max_in_flight=settings.GEMINI_HEDGE_MAX_IN_FLIGHT,
+)
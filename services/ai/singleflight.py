@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Optional, TypeVar
+from core.metrics import metrics
+
+T = TypeVar("T")
+
+
+class _LeaderAbandoned(Exception):
+    """The leading async caller was cancelled; followers must run the call themselves."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key runs it,
+    later callers wait for that result instead of issuing their own.
+    A concurrent.futures.Future is the shared handle, so sync threads and
+    event-loop tasks can follow the same in-flight call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def do(self, key: str, fn: Callable[[], T], labels: Optional[dict] = None) -> tuple[T, bool]:
+        """Run fn once per concurrent key. Returns (result, shared)."""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            metrics.inc("gemini_singleflight_shared", labels)
+            try:
+                return future.result(), True
+            except _LeaderAbandoned:
+                continue
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future)
+            future.set_exception(e)
+            raise
+        self._finish(key, future)
+        future.set_result(result)
+        return result, False
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]], labels: Optional[dict] = None) -> tuple[T, bool]:
+        """Async twin of do; cancelling a follower never cancels the shared call."""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            metrics.inc("gemini_singleflight_shared", labels)
+            try:
+                return await asyncio.shield(asyncio.wrap_future(future)), True
+            except _LeaderAbandoned:
+                continue
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._finish(key, future)
+            future.set_exception(_LeaderAbandoned())
+            raise
+        except BaseException as e:
+            self._finish(key, future)
+            future.set_exception(e)
+            raise
+        self._finish(key, future)
+        future.set_result(result)
+        return result, False
+
+
+gemini_singleflight = SingleFlight()
@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Optional
+from PIL import Image
+from google import genai
+from google.genai import types
+from pydantic import TypeAdapter
+from core.config import settings
+from services.ai.cache import request_key
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_MODES = ("live", "record", "replay", "fake")
+
+
+class CassetteMissing(LookupError):
+    """Replay mode found no recording for a request."""
+
+
+class GeminiTransport(ABC):
+    """
+    What BaseGeminiClient (and the voice token service) needs from Gemini.
+    Live talks to the SDK; record/replay/fake stand in for it so the AI paths
+    can be run and benchmarked without an API key.
+    """
+
+    @abstractmethod
+    def generate(self, model: str, contents: Any, config: Any = None) -> types.GenerateContentResponse:
+        ...
+
+    @abstractmethod
+    async def generate_async(self, model: str, contents: Any, config: Any = None) -> types.GenerateContentResponse:
+        ...
+
+    @abstractmethod
+    def generate_stream_async(self, model: str, contents: Any, config: Any = None) -> AsyncIterator[types.GenerateContentResponse]:
+        ...
+
+    @abstractmethod
+    def embed(self, model: str, text: str, config: Any = None) -> types.EmbedContentResponse:
+        ...
+
+    @abstractmethod
+    def create_auth_token(self, model: str, config: dict) -> types.AuthToken:
+        ...
+
+    # Files API. Only live transports support it: uploaded URIs differ per
+    # run, so recorded/replayed/fake requests send images inline instead.
+    supports_files = False
+
+    def upload_file(self, data: bytes, mime_type: str, display_name: str) -> types.File:
+        raise NotImplementedError(f"{type(self).__name__} does not support the Files API")
+
+    def delete_file(self, name: str):
+        raise NotImplementedError(f"{type(self).__name__} does not support the Files API")
+
+
+class LiveTransport(GeminiTransport):
+    def __init__(self, client: genai.Client):
+        self.client = client
+
+    def generate(self, model, contents, config=None):
+        return self.client.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_async(self, model, contents, config=None):
+        return await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+
+    async def generate_stream_async(self, model, contents, config=None):
+        stream = await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        async for chunk in stream:
+            yield chunk
+
+    def embed(self, model, text, config=None):
+        return self.client.models.embed_content(model=model, contents=text, config=config)
+
+    def create_auth_token(self, model, config):
+        return self.client.auth_tokens.create(config=config)
+
+    supports_files = True
+
+    def upload_file(self, data, mime_type, display_name):
+        return self.client.files.upload(
+            file=io.BytesIO(data),
+            config=types.UploadFileConfig(mime_type=mime_type, display_name=display_name),
+        )
+
+    def delete_file(self, name):
+        self.client.files.delete(name=name)
+
+
+# Cassettes: one JSON file per request, named by the content hash used by the response cache
+
+
+class _Cassettes:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, kind: str, key: str) -> str:
+        return os.path.join(self.directory, kind, f"{key}.json")
+
+    def save(self, kind: str, key: str, model: str, responses: list):
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record = {
+            "kind": kind,
+            "model": model,
+            "recorded_at": time.time(),
+            "responses": [
+                {"type": type(r).__name__, "json": r.model_dump_json(exclude_none=True)} for r in responses
+            ],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def load(self, kind: str, key: str) -> list:
+        path = self.path(kind, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            raise CassetteMissing(f"No {kind} cassette at {path}")
+        return [getattr(types, r["type"]).model_validate_json(r["json"]) for r in record["responses"]]
+
+
+class RecordingTransport(GeminiTransport):
+    """Live calls whose responses are written to cassettes for later replay."""
+
+    def __init__(self, live: LiveTransport, cassettes: _Cassettes):
+        self.live = live
+        self.cassettes = cassettes
+
+    def generate(self, model, contents, config=None):
+        response = self.live.generate(model, contents, config)
+        self.cassettes.save("generate", request_key(model, contents, config), model, [response])
+        return response
+
+    async def generate_async(self, model, contents, config=None):
+        response = await self.live.generate_async(model, contents, config)
+        self.cassettes.save("generate", request_key(model, contents, config), model, [response])
+        return response
+
+    async def generate_stream_async(self, model, contents, config=None):
+        chunks = []
+        async for chunk in self.live.generate_stream_async(model, contents, config):
+            chunks.append(chunk)
+            yield chunk
+        self.cassettes.save("stream", request_key(model, contents, config), model, chunks)
+
+    def embed(self, model, text, config=None):
+        response = self.live.embed(model, text, config)
+        self.cassettes.save("embed", request_key(model, text, config), model, [response])
+        return response
+
+    def create_auth_token(self, model, config):
+        token = self.live.create_auth_token(model, config)
+        # Token configs carry timestamps, so tokens are keyed by model only
+        self.cassettes.save("auth_token", request_key(model, None), model, [token])
+        return token
+
+
+class ReplayTransport(GeminiTransport):
+    """Serves recorded cassettes; a request that was never recorded raises CassetteMissing."""
+
+    def __init__(self, cassettes: _Cassettes):
+        self.cassettes = cassettes
+
+    def generate(self, model, contents, config=None):
+        return self.cassettes.load("generate", request_key(model, contents, config))[0]
+
+    async def generate_async(self, model, contents, config=None):
+        return self.generate(model, contents, config)
+
+    async def generate_stream_async(self, model, contents, config=None):
+        for chunk in self.cassettes.load("stream", request_key(model, contents, config)):
+            yield chunk
+
+    def embed(self, model, text, config=None):
+        return self.cassettes.load("embed", request_key(model, text, config))[0]
+
+    def create_auth_token(self, model, config):
+        return self.cassettes.load("auth_token", request_key(model, None))[0]
+
+
+# Fake mode: synthetic responses shaped by the request config, with sampled latency
+
+
+EMBEDDING_DIMENSIONS = 768
+FAKE_IMAGE_SIZE = (1344, 768)
+
+
+class LatencyModel:
+    """Log-normal latency per model, fitted to a configured [median_ms, p95_ms]."""
+
+    def __init__(self, latencies_ms: dict[str, list[float]], seed: Optional[int] = None):
+        self.latencies_ms = latencies_ms
+        self.random = random.Random(seed)
+
+    def sample(self, model: str) -> float:
+        median_ms, p95_ms = self.latencies_ms.get(model) or self.latencies_ms.get("default") or (0, 0)
+        if median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(p95_ms, median_ms) / median_ms) / 1.645
+        return self.random.lognormvariate(math.log(median_ms), sigma) / 1000
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def _fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    # Hashed bag of words: overlapping topics land close together, like real embeddings
+    vector = [0.0] * dimensions
+    for word in _words(text):
+        digest = hashlib.sha256(word.encode()).digest()
+        index = int.from_bytes(digest[:4], "big") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _fake_string(name: str, rng: random.Random) -> str:
+    name = name.lower()
+    if "icon" in name:
+        return rng.choice(["fa-solid fa-recycle", "fa-solid fa-leaf", "fa-solid fa-seedling", "fa-solid fa-bottle-water"])
+    if "prompt" in name:
+        return "A realistic photo of an upcycled household object on a wooden table"
+    if "title" in name:
+        return f"Synthetic {rng.choice(['reuse', 'repair', 'refill', 'compost'])} idea {rng.randint(1, 99)}"
+    return "Synthetic text produced by the fake Gemini transport for offline runs and benchmarks."
+
+
+def _fake_from_schema(schema: dict, defs: dict, rng: random.Random, name: str = "") -> Any:
+    if "$ref" in schema:
+        return _fake_from_schema(defs[schema["$ref"].split("/")[-1]], defs, rng, name)
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _fake_from_schema(sub, defs, rng, key) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = max(schema.get("minItems", 0), min(3, schema.get("maxItems", 3)))
+        return [_fake_from_schema(schema.get("items", {}), defs, rng, name) for _ in range(count)]
+    if kind == "integer":
+        return rng.randint(1, 10)
+    if kind == "number":
+        return round(rng.random(), 3)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return _fake_string(name, rng)
+
+
+def _fake_image(rng: random.Random) -> bytes:
+    color = tuple(rng.randint(40, 200) for _ in range(3))
+    buf = io.BytesIO()
+    Image.new("RGB", FAKE_IMAGE_SIZE, color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _as_config(config: Any) -> Optional[types.GenerateContentConfig]:
+    if config is None or isinstance(config, types.GenerateContentConfig):
+        return config
+    return types.GenerateContentConfig.model_validate(config)
+
+
+def _response(parts: list[types.Part]) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=parts), finish_reason="STOP")]
+    )
+
+
+class FakeTransport(GeminiTransport):
+    """
+    Synthetic Gemini: JSON that satisfies the request's response schema,
+    placeholder PNGs for image requests, Markdown for plain text and
+    bag-of-words embeddings. Content is deterministic per request; only the
+    latency is random.
+    """
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def _text_for(self, model: str, contents: Any, config: Any) -> types.GenerateContentResponse:
+        key = request_key(model, contents, config)
+        rng = random.Random(key)
+        cfg = _as_config(config)
+        if cfg and cfg.response_modalities and "IMAGE" in [str(m).upper() for m in cfg.response_modalities]:
+            return _response([types.Part(inline_data=types.Blob(data=_fake_image(rng), mime_type="image/png"))])
+        if cfg and (cfg.response_json_schema is not None or cfg.response_schema is not None):
+            schema = cfg.response_json_schema or TypeAdapter(cfg.response_schema).json_schema()
+            payload = _fake_from_schema(schema, schema.get("$defs", {}), rng)
+            return _response([types.Part.from_text(text=json.dumps(payload))])
+        if cfg and cfg.response_mime_type == "application/json":
+            return _response([types.Part.from_text(text="{}")])
+        text = (
+            "# Synthetic Guide\n\n## 🛠️ Tools & Materials Needed\n- Scissors\n- Glue\n\n"
+            "## 📝 The Process\n1. Clean the material.\n2. Cut it to shape.\n3. Assemble.\n\n"
+            f"## 💡 Pro Tip\nRequest {key[:8]} was served by the fake transport."
+        )
+        return _response([types.Part.from_text(text=text)])
+
+    def generate(self, model, contents, config=None):
+        time.sleep(self.latency.sample(model))
+        return self._text_for(model, contents, config)
+
+    async def generate_async(self, model, contents, config=None):
+        await asyncio.sleep(self.latency.sample(model))
+        return self._text_for(model, contents, config)
+
+    async def generate_stream_async(self, model, contents, config=None):
+        total = self.latency.sample(model)
+        text = self._text_for(model, contents, config).text or ""
+        chunks = [text[i:i + 64] for i in range(0, len(text), 64)] or [""]
+        # Roughly a quarter of the time goes to the first token
+        await asyncio.sleep(total * 0.25)
+        for chunk in chunks:
+            yield _response([types.Part.from_text(text=chunk)])
+            await asyncio.sleep(total * 0.75 / len(chunks))
+
+    def embed(self, model, text, config=None):
+        time.sleep(self.latency.sample(model))
+        dimensions = getattr(config, "output_dimensionality", None) or EMBEDDING_DIMENSIONS
+        return types.EmbedContentResponse(embeddings=[types.ContentEmbedding(values=_fake_embedding(text, dimensions))])
+
+    def create_auth_token(self, model, config):
+        return types.AuthToken(name=f"auth_tokens/fake-{uuid.uuid4().hex}")
+
+
+def build_transport(client: Optional[genai.Client]) -> Optional[GeminiTransport]:
+    """Transport for GEMINI_TRANSPORT; None when a live/record client is unavailable."""
+    mode = settings.GEMINI_TRANSPORT
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f"GEMINI_TRANSPORT must be one of {', '.join(TRANSPORT_MODES)}, got {mode!r}")
+    if mode == "fake":
+        return FakeTransport(LatencyModel(settings.GEMINI_FAKE_LATENCY_MS, settings.GEMINI_FAKE_SEED))
+    if mode == "replay":
+        return ReplayTransport(_Cassettes(settings.GEMINI_CASSETTE_DIR))
+    if client is None:
+        return None
+    if mode == "record":
+        return RecordingTransport(LiveTransport(client), _Cassettes(settings.GEMINI_CASSETTE_DIR))
+    return LiveTransport(client)
@@ -15,7 +15,7 @@ from core.security import hash_password, verify_password
 from models import Impact, Material, RefreshToken, Step, User
 from services.email_blocklist import email_blocklist
 from services.email_service import email_service
-from services.material_service import delete_material
+from services.storage_gc import material_prefix, record_deletions
 from utils.tokens import (
     create_access_token,
     create_email_verification_token,
@@ -237,9 +237,10 @@ def logout(db: Session, refresh_token: str) -> None:
         db.commit()
 
 def delete_account(db: Session, user: User) -> None:
-    user_materials = db.query(Material).filter(Material.owner_id == user.id).all()
-    for material in user_materials:
-        delete_material(db, material.id, user.id)
+    # One transaction: R2 folders are tombstoned and ways/jobs/checkpoints go via FK cascades
+    material_ids = [material_id for (material_id,) in db.query(Material.id).filter(Material.owner_id == user.id)]
+    record_deletions(db, (material_prefix(material_id) for material_id in material_ids))
+    db.query(Material).filter(Material.owner_id == user.id).delete(synchronize_session=False)
     db.query(Step).filter(Step.owner_id == user.id).delete(synchronize_session=False)
     db.query(Impact).filter(Impact.owner_id == user.id).delete(synchronize_session=False)
     db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete(synchronize_session=False)
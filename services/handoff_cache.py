@@ -0,0 +1,102 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class HandoffCache:
+    """
+    Local hand-off of uploaded bytes from the API to a worker in the same process.
+    A bounded in-memory LRU; entries evicted from memory spill to a temp
+    directory (itself bounded), and misses fall back to the object store.
+    """
+
+    def __init__(self, max_memory_bytes: int, max_spill_bytes: int, spill_dir: Optional[str] = None):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_spill_bytes = max_spill_bytes
+        self._spill_dir = spill_dir
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._spilled: "OrderedDict[str, int]" = OrderedDict()
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+
+    def _spill_path(self, key: str) -> str:
+        if not self._spill_dir:
+            self._spill_dir = tempfile.mkdtemp(prefix="greensteps-handoff-")
+        os.makedirs(self._spill_dir, exist_ok=True)
+        return os.path.join(self._spill_dir, key)
+
+    def _spill(self, key: str, data: bytes):
+        if len(data) > self.max_spill_bytes:
+            return
+        try:
+            with open(self._spill_path(key), "wb") as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning(f"Failed to spill hand-off entry {key}: {e}")
+            return
+        self._spilled[key] = len(data)
+        self._spilled_bytes += len(data)
+        while self._spilled_bytes > self.max_spill_bytes:
+            old_key, size = self._spilled.popitem(last=False)
+            self._spilled_bytes -= size
+            self._remove_file(old_key)
+
+    def _remove_file(self, key: str):
+        try:
+            os.remove(self._spill_path(key))
+        except OSError:
+            pass
+
+    def _drop(self, key: str):
+        data = self._memory.pop(key, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+        size = self._spilled.pop(key, None)
+        if size is not None:
+            self._spilled_bytes -= size
+            self._remove_file(key)
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._drop(key)
+            if len(data) > self.max_memory_bytes:
+                self._spill(key, data)
+                return
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                old_key, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
+                self._spill(old_key, old_data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            if key not in self._spilled:
+                return None
+            try:
+                with open(self._spill_path(key), "rb") as f:
+                    return f.read()
+            except OSError:
+                self._spilled_bytes -= self._spilled.pop(key)
+                return None
+
+    def discard(self, key: str):
+        with self._lock:
+            self._drop(key)
+
+
+handoff_cache = HandoffCache(
+    max_memory_bytes=settings.HANDOFF_CACHE_MAX_MEMORY_BYTES,
+    max_spill_bytes=settings.HANDOFF_CACHE_MAX_SPILL_BYTES,
+    spill_dir=settings.HANDOFF_CACHE_DIR or None,
+)
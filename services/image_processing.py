@@ -0,0 +1,209 @@
+import asyncio
+import base64
+import binascii
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+from PIL import Image, ImageOps
+from core.config import settings
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Pillow format name -> (content type, file extension)
+FORMATS = {
+    "WEBP": ("image/webp", "webp"),
+    "AVIF": ("image/avif", "avif"),
+    "JPEG": ("image/jpeg", "jpg"),
+    "PNG": ("image/png", "png"),
+}
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    content_type: str
+    extension: str
+    width: int
+    height: int
+
+
+def _format_info(fmt: str) -> tuple[str, str, str]:
+    fmt = fmt.upper()
+    if fmt == "JPG":
+        fmt = "JPEG"
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported image format: {fmt}")
+    content_type, extension = FORMATS[fmt]
+    return fmt, content_type, extension
+
+
+def extension_for(fmt: str) -> str:
+    return _format_info(fmt)[2]
+
+
+def sniff_content_type(data: bytes) -> str:
+    """Detect the content type from the image header without decoding pixels."""
+    with Image.open(io.BytesIO(data)) as img:
+        fmt = img.format or "PNG"
+    return FORMATS.get(fmt, (f"image/{fmt.lower()}", fmt.lower()))[0]
+
+
+def encode_image(img: Image.Image, fmt: str, quality: int) -> EncodedImage:
+    fmt, content_type, extension = _format_info(fmt)
+    if fmt == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+    buf = io.BytesIO()
+    options = {"optimize": True} if fmt == "PNG" else {"quality": quality}
+    if fmt == "WEBP":
+        options["method"] = 4
+    elif fmt == "AVIF":
+        options["speed"] = 6
+    img.save(buf, format=fmt, **options)
+    return EncodedImage(buf.getvalue(), content_type, extension, img.width, img.height)
+
+
+def load_upload(data: bytes, max_edge: int | None = None) -> Image.Image:
+    """
+    Decode an upload, apply its EXIF orientation and drop all metadata.
+    With `max_edge`, JPEGs are decoded at a reduced scale (DCT scaling),
+    which is much cheaper than decoding full size and downscaling.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        if max_edge:
+            img.draft("RGB", (max_edge, max_edge))
+        img.load()
+    except Exception as e:
+        raise ValueError("Invalid image format") from e
+
+    img = ImageOps.exif_transpose(img)
+    # Strip EXIF/ICC/comments so nothing from the device leaks into stored copies
+    img.info = {}
+    return img
+
+
+def resize_and_encode(img: Image.Image, max_edge: int, fmt: str, quality: int) -> EncodedImage:
+    """Downscale (never upscale) so the longest edge is at most `max_edge`, then encode."""
+    img = img.copy()
+    img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return encode_image(img, fmt, quality)
+
+
+def process_generated_image(data: bytes, max_width: int, max_height: int, fmt: str, quality: int) -> EncodedImage:
+    """
+    Decode a Gemini image (raw bytes, or base64 text from older responses),
+    fit it inside max_width x max_height keeping its aspect ratio and encode.
+    Module-level so it can run in the image process pool.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        try:
+            img = Image.open(io.BytesIO(base64.b64decode(data)))
+            img.load()
+        except (binascii.Error, OSError, ValueError) as e:
+            raise ValueError("Generated image could not be decoded") from e
+
+    img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+    return encode_image(img, fmt, quality)
+
+
+def build_variants(
+    data: bytes, widths: list[int], fmt: str, quality: int, placeholder_width: int
+) -> tuple[list[EncodedImage], str]:
+    """
+    Responsive derivatives of a stored image at each configured width (never
+    upscaled, so widths at or above the source width are skipped) plus a
+    placeholder: a data URI of a tiny copy that clients stretch and blur
+    while the real image loads. Module-level so it can run in the pool.
+    """
+    img = load_upload(data)
+    variants = []
+    for width in sorted(set(widths)):
+        if width >= img.width:
+            break
+        height = max(1, round(img.height * width / img.width))
+        variants.append(encode_image(img.resize((width, height), Image.Resampling.LANCZOS), fmt, quality))
+
+    tiny_height = max(1, round(img.height * placeholder_width / img.width))
+    tiny = encode_image(img.resize((placeholder_width, tiny_height), Image.Resampling.BOX), "WEBP", 30)
+    placeholder = f"data:{tiny.content_type};base64,{base64.b64encode(tiny.data).decode('ascii')}"
+    return variants, placeholder
+
+
+class ImageProcessPool:
+    """
+    Small process pool for CPU-bound decode/resize/encode work, so it doesn't
+    hold the GIL against the pipeline's I/O threads. Created on first use;
+    with max_workers=0, or where processes can't be started (e.g. Lambda has
+    no /dev/shm), work runs inline in the calling thread.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._unavailable = max_workers <= 0
+        self._lock = threading.Lock()
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        with self._lock:
+            if self._executor is None and not self._unavailable:
+                try:
+                    # spawn: forking a process that runs worker threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                except (OSError, NotImplementedError) as e:
+                    logger.warning(f"Image process pool unavailable, processing inline: {e}")
+                    self._unavailable = True
+            return self._executor
+
+    def _discard(self, pool: ProcessPoolExecutor):
+        # A worker died (e.g. OOM-killed); the next call starts a fresh pool
+        with self._lock:
+            if self._executor is pool:
+                self._executor = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable[..., T], *args) -> T:
+        pool = self._pool()
+        with metrics.timer("image_processing_seconds", {"fn": fn.__name__, "pool": str(pool is not None).lower()}):
+            if pool is None:
+                return fn(*args)
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise
+
+    async def run_async(self, fn: Callable[..., T], *args) -> T:
+        pool = self._pool()
+        with metrics.timer("image_processing_seconds", {"fn": fn.__name__, "pool": str(pool is not None).lower()}):
+            if pool is None:
+                return await asyncio.to_thread(fn, *args)
+            try:
+                return await asyncio.wrap_future(pool.submit(fn, *args))
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+image_pool = ImageProcessPool(settings.IMAGE_PROCESS_POOL_WORKERS)
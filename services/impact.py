@@ -1,114 +1,87 @@
+from typing import AsyncIterator, Optional
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from models import Impact, Step, User
+from core.database import SessionLocal
 from core.logging import logger
+from core.metrics import metrics
+from services import impact_cache
 from services.ai.gemini_impact import gemini_impact
+from services.ai.json_stream import JsonStreamParser
+from schemas.ai import ImpactPlan, ImpactPlanStep, MAX_DESC_LEN, MAX_STEPS, MAX_TITLE_LEN
 
-MAX_STEPS = 12
-MAX_TITLE_LEN = 120
-MAX_DESC_LEN = 400
+def _step_to_dict(order: int, step: ImpactPlanStep) -> dict:
+    return {"order": order, "title": step.title, "description": step.description, "icon": step.icon}
+
+def _validate_step(key, step) -> dict:
+    try:
+        order = int(str(key).strip())
+    except ValueError:
+        raise ValueError("Step keys must be numeric")
+    return _step_to_dict(order, ImpactPlanStep.model_validate(step))
 
 def _validate_ai_payload(payload: dict) -> dict:
-    if not isinstance(payload, dict):
-        raise ValueError("Payload must be an object")
-    title = payload.get("title")
-    description = payload.get("descreption") or payload.get("description")
-    steps = payload.get("steps")
-    
-    if not isinstance(title, str) or not title.strip():
-        raise ValueError("Missing title")
-    if not isinstance(description, str) or not description.strip():
-        raise ValueError("Missing descreption")
-    if not steps:
-        raise ValueError("Missing steps")
-
-    title = title.strip()[:MAX_TITLE_LEN]
-    description = description.strip()[:MAX_DESC_LEN]
-
-    parsed_steps = []
-    seen_orders = set()
-    
-    if isinstance(steps, list):
-        step_items = list(enumerate(steps, start=1))
-    elif isinstance(steps, dict):
-        step_items = list(steps.items())
-    else:
-        raise ValueError("Steps must be a list or object")
-
-    for key, step in step_items:
-        try:
-            order = int(str(key).strip())
-        except ValueError:
-            raise ValueError("Step keys must be numeric")
-        
-        if order in seen_orders:
-            raise ValueError("Duplicate step order")
-        seen_orders.add(order)
-        
-        if not isinstance(step, dict):
-            raise ValueError("Step must be an object")
-            
-        step_title = step.get("title")
-        step_description = step.get("descreption") or step.get("description")
-        step_icon = step.get("icon")
-        
-        if not isinstance(step_title, str) or not step_title.strip():
-            raise ValueError("Step title missing")
-        if not isinstance(step_description, str) or not step_description.strip():
-            raise ValueError("Step descreption missing")
-        if not isinstance(step_icon, str) or not step_icon.strip():
-            raise ValueError("Step icon missing")
-            
-        parsed_steps.append(
-            {
-                "order": order,
-                "title": step_title.strip()[:MAX_TITLE_LEN],
-                "description": step_description.strip()[:MAX_DESC_LEN],
-                "icon": step_icon.strip()[:MAX_TITLE_LEN],
-            }
-        )
+    # pydantic's ValidationError is a ValueError, so callers' handling is unchanged
+    plan = ImpactPlan.model_validate(payload)
+    return {
+        "title": plan.title,
+        "description": plan.description,
+        "steps": [_step_to_dict(order, step) for order, step in enumerate(plan.steps, start=1)],
+    }
 
-    parsed_steps.sort(key=lambda item: item["order"])
-    if len(parsed_steps) > MAX_STEPS:
-        raise ValueError("Too many steps")
-    if not parsed_steps:
-        raise ValueError("No steps generated")
-    if parsed_steps[0]["order"] != 1:
-        raise ValueError("Step order must start at 1")
-        
-    expected = list(range(1, len(parsed_steps) + 1))
-    if [step["order"] for step in parsed_steps] != expected:
-        raise ValueError("Step order must be sequential")
-        
-    return {"title": title, "description": description, "steps": parsed_steps}
+def _invalid_output_error(exc: Exception, raw_text: str) -> HTTPException:
+    preview = (raw_text or "").strip()
+    if len(preview) > 1200:
+        preview = preview[:1200] + "...(truncated)"
+    
+    logger.error(f"AI impact generation failed: {exc}. Raw: {preview}")
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail={
+            "code": "invalid_ai_output",
+            "message": "AI output invalid or parsing failed",
+            "details": {"ai_output_preview": preview},
+        },
+    )
 
-def create_impact_from_prompt(db: Session, user: User, topic: str):
+def _generate_plan(user: User, topic: str) -> dict:
     raw_text = ""
     try:
         try:
             payload, raw_text = gemini_impact.generate_impact_payload(topic, user)
-            parsed = _validate_ai_payload(payload)
+            return _validate_ai_payload(payload)
+        except HTTPException:
+            raise
         except Exception as exc:
             logger.warning(f"First AI attempt failed: {exc}. Retrying...")
-            payload, raw_text = gemini_impact.generate_impact_payload(topic, user)
-            parsed = _validate_ai_payload(payload)
+            metrics.inc("impact_generation_retries", {"reason": type(exc).__name__})
+            payload, raw_text = gemini_impact.generate_impact_payload(topic, user, fresh=True)
+            return _validate_ai_payload(payload)
     except HTTPException:
         raise
     except Exception as exc:
-        preview = (raw_text or "").strip()
-        if len(preview) > 1200:
-            preview = preview[:1200] + "...(truncated)"
-        
-        logger.error(f"AI impact generation failed: {exc}. Raw: {preview}")
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail={
-                "code": "invalid_ai_output",
-                "message": "AI output invalid or parsing failed",
-                "details": {"ai_output_preview": preview},
-            },
-        ) from exc
+        raise _invalid_output_error(exc, raw_text) from exc
 
+async def _generate_plan_async(user: User, topic: str) -> dict:
+    raw_text = ""
+    try:
+        try:
+            payload, raw_text = await gemini_impact.generate_impact_payload_async(topic, user)
+            return _validate_ai_payload(payload)
+        except HTTPException:
+            raise
+        except Exception as exc:
+            logger.warning(f"First AI attempt failed: {exc}. Retrying...")
+            metrics.inc("impact_generation_retries", {"reason": type(exc).__name__})
+            payload, raw_text = await gemini_impact.generate_impact_payload_async(topic, user, fresh=True)
+            return _validate_ai_payload(payload)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise _invalid_output_error(exc, raw_text) from exc
+
+def _persist_impact(db: Session, user: User, parsed: dict):
     impact = Impact(
         title=parsed["title"],
         description=parsed["description"],
@@ -135,6 +108,99 @@ def create_impact_from_prompt(db: Session, user: User, topic: str):
     db.refresh(impact)
     return impact, steps
 
+def _persist_and_store(db: Session, user: User, lookup: impact_cache.TopicLookup, parsed: dict):
+    result = _persist_impact(db, user, parsed)
+    impact_cache.store_plan(db, user, lookup, parsed)
+    return result
+
+def create_impact_from_prompt(db: Session, user: User, topic: str):
+    lookup = impact_cache.lookup_plan(db, user, topic)
+    if lookup.plan:
+        # Cached plans are cloned into fresh rows owned by this user
+        return _persist_impact(db, user, lookup.plan)
+    parsed = _generate_plan(user, topic)
+    return _persist_and_store(db, user, lookup, parsed)
+
+async def create_impact_from_prompt_async(db: Session, user: User, topic: str):
+    """Same as create_impact_from_prompt, but the AI call doesn't hold a thread while it runs."""
+    lookup = await run_in_threadpool(impact_cache.lookup_plan, db, user, topic)
+    if lookup.plan:
+        return await run_in_threadpool(_persist_impact, db, user, lookup.plan)
+    parsed = await _generate_plan_async(user, topic)
+    return await run_in_threadpool(_persist_and_store, db, user, lookup, parsed)
+
+def _stream_event(path: tuple, value, expected_order: int) -> Optional[tuple[str, dict]]:
+    """Validate one completed top-level value or step of a streamed plan."""
+    if path == ("title",):
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError("Missing title")
+        return "title", {"title": value.strip()[:MAX_TITLE_LEN]}
+    if path in (("descreption",), ("description",)):
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError("Missing descreption")
+        return "description", {"description": value.strip()[:MAX_DESC_LEN]}
+    if len(path) == 2 and path[0] == "steps":
+        # List steps are numbered from 1, as in _validate_ai_payload
+        key = path[1] + 1 if isinstance(path[1], int) else path[1]
+        step = _validate_step(key, value)
+        if step["order"] != expected_order:
+            raise ValueError("Step order must be sequential")
+        if step["order"] > MAX_STEPS:
+            raise ValueError("Too many steps")
+        return "step", step
+    return None
+
+async def stream_impact_from_prompt(user: User, topic: str) -> AsyncIterator[tuple[str, dict]]:
+    """
+    Streamed variant of create_impact_from_prompt. Yields (event, data) pairs:
+    title, description and each validated step as soon as Gemini produces it,
+    then complete with the persisted impact and steps. Rows are written only
+    once the whole plan validates; invalid output raises invalid_ai_output.
+    Uses its own session because it outlives the request's dependencies.
+    """
+    db = SessionLocal()
+    try:
+        lookup = await run_in_threadpool(impact_cache.lookup_plan, db, user, topic)
+        if lookup.plan:
+            parsed = lookup.plan
+            yield "title", {"title": parsed["title"]}
+            yield "description", {"description": parsed["description"]}
+            for step in parsed["steps"]:
+                yield "step", step
+            impact, steps = await run_in_threadpool(_persist_impact, db, user, parsed)
+            yield "complete", {"impact": impact, "steps": steps}
+            return
+
+        parser = JsonStreamParser()
+        raw_text = []
+        next_order = 1
+        stream = gemini_impact.stream_impact_payload(topic, user)
+        try:
+            async for chunk in stream:
+                raw_text.append(chunk)
+                for path, value in parser.feed(chunk):
+                    event = _stream_event(path, value, next_order)
+                    if event is None:
+                        continue
+                    if event[0] == "step":
+                        next_order += 1
+                    yield event
+            if not parser.done:
+                raise ValueError("AI response ended before the plan was complete")
+            parsed = _validate_ai_payload(parser.root)
+        except HTTPException:
+            raise
+        except Exception as exc:
+            raise _invalid_output_error(exc, "".join(raw_text)) from exc
+        finally:
+            # Releases the limiter slot promptly when we stop early
+            await stream.aclose()
+
+        impact, steps = await run_in_threadpool(_persist_and_store, db, user, lookup, parsed)
+        yield "complete", {"impact": impact, "steps": steps}
+    finally:
+        db.close()
+
 def get_impact_with_steps(db: Session, user_id: str, impact_id: str):
     impact = (
         db.query(Impact)
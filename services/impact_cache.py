@@ -0,0 +1,144 @@
+import math
+import operator
+import re
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from core.config import settings
+from core.logging import logger
+from core.metrics import metrics
+from models import ImpactTemplate, User
+from services.ai.gemini_impact import gemini_impact
+
+AGE_BANDS = ((12, "child"), (17, "teen"), (24, "young-adult"), (44, "adult"), (64, "middle-aged"))
+
+
+def normalize_topic(topic: str) -> str:
+    cleaned = re.sub(r"[^\w\s]", " ", topic.lower())
+    return " ".join(cleaned.split())
+
+
+def profile_bucket(user: User) -> str:
+    """Coarse profile: age band plus the normalized interest set."""
+    if user.age is None:
+        band = "unknown"
+    else:
+        band = next((name for limit, name in AGE_BANDS if user.age <= limit), "senior")
+    interests = sorted({normalize_topic(str(i)) for i in (user.interests or []) if str(i).strip()})
+    return f"{band}|{','.join(interests)}"
+
+
+def _ttl() -> timedelta:
+    return timedelta(days=settings.IMPACT_CACHE_TTL_DAYS)
+
+
+def _unit(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+
+def _similarity(a: list[float], b: list[float]) -> float:
+    # Both vectors are stored unit-length
+    return sum(map(operator.mul, a, b))
+
+
+def _mentions_user(plan: dict, user: User) -> bool:
+    names = [n for n in (user.full_name or "").lower().split() if len(n) > 2]
+    if not names:
+        return False
+    texts = [plan["title"], plan["description"]]
+    for step in plan["steps"]:
+        texts.extend((step["title"], step["description"]))
+    blob = " ".join(texts).lower()
+    return any(re.search(rf"\b{re.escape(n)}\b", blob) for n in names)
+
+
+class TopicLookup:
+    """Result of a cache lookup; carries the embedding so a miss can be stored without re-embedding."""
+
+    def __init__(self, topic: str, bucket: str, plan: Optional[dict] = None, embedding: Optional[list[float]] = None):
+        self.topic = topic
+        self.bucket = bucket
+        self.plan = plan
+        self.embedding = embedding
+
+
+def lookup_plan(db: Session, user: User, topic: str) -> TopicLookup:
+    lookup = TopicLookup(normalize_topic(topic), profile_bucket(user))
+    if not settings.IMPACT_CACHE_ENABLED or not lookup.topic:
+        return lookup
+
+    fresh = db.query(ImpactTemplate).filter(
+        ImpactTemplate.profile_bucket == lookup.bucket,
+        ImpactTemplate.created_at >= func.now() - _ttl(),
+    )
+
+    template = fresh.filter(ImpactTemplate.topic == lookup.topic).order_by(ImpactTemplate.created_at.desc()).first()
+    kind = "exact"
+    if template is None:
+        try:
+            lookup.embedding = _unit(gemini_impact.embed_topic(lookup.topic))
+        except Exception as e:
+            # Embedding is an optimization; generation still works without it
+            logger.warning(f"Topic embedding failed, skipping semantic lookup: {e}")
+            metrics.inc("impact_cache_misses")
+            return lookup
+
+        # Score on (id, embedding) only; the plan is loaded for the best match alone
+        candidates = (
+            fresh.with_entities(ImpactTemplate.id, ImpactTemplate.embedding)
+            .filter(ImpactTemplate.embedding.isnot(None))
+            .order_by(ImpactTemplate.created_at.desc())
+            .limit(settings.IMPACT_CACHE_MAX_CANDIDATES)
+            .all()
+        )
+        best_id, best_score = None, 0.0
+        for candidate_id, embedding in candidates:
+            if len(embedding) != len(lookup.embedding):
+                # Stored under another IMPACT_EMBEDDING_DIMENSIONS; ages out with the TTL
+                continue
+            score = _similarity(lookup.embedding, embedding)
+            if score > best_score:
+                best_id, best_score = candidate_id, score
+        if best_id is not None and best_score >= settings.IMPACT_CACHE_SIMILARITY_THRESHOLD:
+            template = db.get(ImpactTemplate, best_id)
+        kind = "semantic"
+
+    if template is None:
+        metrics.inc("impact_cache_misses")
+        return lookup
+
+    template.hits += 1
+    template.last_used_at = func.now()
+    db.commit()
+    metrics.inc("impact_cache_hits", {"kind": kind})
+    logger.info(f"Impact topic cache {kind} hit for '{lookup.topic}' (template {template.id})")
+    lookup.plan = template.plan
+    return lookup
+
+
+def store_plan(db: Session, user: User, lookup: TopicLookup, plan: dict):
+    """Keep a freshly generated plan for reuse, dropping expired ones. Never raises."""
+    if not settings.IMPACT_CACHE_ENABLED or not lookup.topic:
+        return
+    if _mentions_user(plan, user):
+        # Personalized by name; not safe to hand to someone else
+        return
+    try:
+        # Lookups already ignore expired rows; delete them so the table stays bounded
+        db.query(ImpactTemplate).filter(
+            ImpactTemplate.created_at < func.now() - _ttl()
+        ).delete(synchronize_session=False)
+        db.add(
+            ImpactTemplate(
+                topic=lookup.topic,
+                profile_bucket=lookup.bucket,
+                embedding=lookup.embedding,
+                plan=plan,
+            )
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to store impact template for '{lookup.topic}': {e}")
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from typing import Any, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.database import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "material_events"
+TERMINAL_EVENTS = ("ready", "failed")
+NOTIFY_MAX_BYTES = 7900
+
+# Tags our own NOTIFYs so the listener doesn't deliver local events twice
+_origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Subscription:
+    """An SSE client's view of one material's events, bound to its event loop."""
+
+    def __init__(self, material_id: str):
+        self.material_id = material_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def deliver(self, event: dict):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MaterialEventBroker:
+    """
+    Fans pipeline stage transitions out to SSE subscribers.
+    Events are delivered in-process directly and, when enabled, across
+    processes through Postgres LISTEN/NOTIFY (workers may run elsewhere).
+    """
+
+    def __init__(self, use_pg_notify: bool):
+        self.use_pg_notify = use_pg_notify
+        self._subscribers: dict[str, set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._listener: Optional[threading.Thread] = None
+
+    def subscribe(self, material_id) -> Subscription:
+        subscription = Subscription(str(material_id))
+        with self._lock:
+            self._subscribers.setdefault(subscription.material_id, set()).add(subscription)
+            if self.use_pg_notify and (self._listener is None or not self._listener.is_alive()):
+                self._listener = threading.Thread(target=self._listen, daemon=True, name="MaterialEventListener")
+                self._listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.material_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.material_id]
+
+    def _dispatch(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event["material_id"], ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # Subscriber's loop is closed; it will be unsubscribed on disconnect
+                pass
+
+    def publish(self, material_id, event: str, data: Optional[dict[str, Any]] = None, db: Optional[Session] = None):
+        """
+        Publish a stage transition. Never raises: events are best-effort.
+        Pass the caller's session (e.g. the pipeline job's) to send the NOTIFY
+        on its connection instead of checking out another one; it is committed.
+        """
+        payload = {"material_id": str(material_id), "event": event, "data": data or {}}
+        self._dispatch(payload)
+        if not self.use_pg_notify:
+            return
+        try:
+            message = json.dumps({**payload, "origin": _origin})
+            if len(message.encode()) > NOTIFY_MAX_BYTES:
+                # NOTIFY payloads are capped at 8000 bytes; clients can fetch the details
+                message = json.dumps({**payload, "data": {}, "origin": _origin})
+            notify = text("SELECT pg_notify(:channel, :payload)")
+            params = {"channel": CHANNEL, "payload": message}
+            if db is not None:
+                try:
+                    db.execute(notify, params)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+                return
+            with engine.connect() as conn:
+                conn.execute(notify, params)
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"Failed to publish material event {event} for {material_id}: {e}")
+
+    def _listen(self):
+        while True:
+            try:
+                conn = engine.raw_connection()
+                try:
+                    dbapi_conn = conn.driver_connection
+                    dbapi_conn.autocommit = True
+                    with dbapi_conn.cursor() as cursor:
+                        cursor.execute(f"LISTEN {CHANNEL}")
+                    logger.info("Listening for material events")
+                    while True:
+                        if select.select([dbapi_conn], [], [], 30) == ([], [], []):
+                            continue
+                        dbapi_conn.poll()
+                        while dbapi_conn.notifies:
+                            notify = dbapi_conn.notifies.pop(0)
+                            event = json.loads(notify.payload)
+                            if event.pop("origin", None) != _origin:
+                                self._dispatch(event)
+                finally:
+                    conn.invalidate()
+            except Exception as e:
+                logger.error(f"Material event listener failed, reconnecting: {e}")
+                time.sleep(5)
+
+
+material_events = MaterialEventBroker(use_pg_notify=settings.MATERIAL_EVENTS_USE_PG_NOTIFY)
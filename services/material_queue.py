@@ -1,49 +1,352 @@
+import os
+import socket
 import threading
-import queue
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional
 from uuid import UUID
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.database import SessionLocal
+from core.metrics import metrics
+from models.material import Material
+from models.material_job import MaterialJob
+from services.handoff_cache import handoff_cache
+from services.material_events import material_events
 from services.material_service import process_material_background
 
 logger = logging.getLogger(__name__)
 
-# Create a FIFO queue
-material_queue = queue.Queue()
+# Jobs live in Postgres (material_jobs) so they survive restarts and can be
+# claimed by workers in any process with SELECT ... FOR UPDATE SKIP LOCKED.
 stop_event = threading.Event()
+# Set on local enqueue so idle workers in this process don't wait a full poll interval
+wakeup_event = threading.Event()
 
-def worker():
+_worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+_workers: list[threading.Thread] = []
+_running_jobs: dict[UUID, str] = {}
+_stats_lock = threading.Lock()
+_stats = {
+    "active_jobs": 0,
+    "jobs_processed": 0,
+    "jobs_failed": 0,
+    "total_job_seconds": 0.0,
+    "last_job_seconds": None,
+}
+
+def _lease() -> timedelta:
+    return timedelta(seconds=settings.MATERIAL_JOB_VISIBILITY_TIMEOUT_SECONDS)
+
+# --- Job State Transitions ---
+
+def _claim_job(worker_id: str) -> Optional[tuple[UUID, UUID, int, int]]:
+    """Atomically claim the next runnable job, including ones whose lease expired."""
+    with SessionLocal() as db:
+        now = func.now()
+        job = (
+            db.query(MaterialJob)
+            .filter(
+                or_(
+                    and_(MaterialJob.status == "queued", MaterialJob.run_after <= now),
+                    and_(
+                        MaterialJob.status == "processing",
+                        MaterialJob.locked_until < now,
+                        MaterialJob.attempts < MaterialJob.max_attempts,
+                    ),
+                )
+            )
+            .order_by(MaterialJob.run_after)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if not job:
+            return None
+
+        claimed = (job.id, job.material_id, job.attempts + 1, job.max_attempts)
+        job.status = "processing"
+        job.attempts = job.attempts + 1
+        job.locked_by = worker_id
+        job.locked_until = now + _lease()
+        db.commit()
+        return claimed
+
+def _complete_job(job_id: UUID, worker_id: str):
+    with SessionLocal() as db:
+        db.query(MaterialJob).filter(
+            MaterialJob.id == job_id, MaterialJob.locked_by == worker_id
+        ).update(
+            {"status": "done", "locked_by": None, "locked_until": None, "last_error": None},
+            synchronize_session=False,
+        )
+        db.commit()
+
+def _set_material_status(db: Session, material_id: UUID, values: dict) -> bool:
+    """Update the material unless it is already ready; returns whether it changed."""
+    updated = db.query(Material).filter(
+        Material.id == material_id, Material.status != "ready"
+    ).update(values, synchronize_session=False)
+    return updated > 0
+
+def _mark_material_failed(db: Session, material_id: UUID) -> bool:
+    return _set_material_status(
+        db, material_id, {"status": "failed", "error_message": "Generation failed. Please try again."}
+    )
+
+def _fail_job(job_id: UUID, material_id: UUID, worker_id: str, attempts: int, max_attempts: int, error: str):
+    """Schedule a retry with linear backoff, or give up once attempts are exhausted."""
+    with SessionLocal() as db:
+        job = (
+            db.query(MaterialJob)
+            .filter(MaterialJob.id == job_id, MaterialJob.locked_by == worker_id)
+            .with_for_update()
+            .first()
+        )
+        if not job:
+            # Lease was lost to another worker; it owns the job now
+            return
+        job.last_error = error[:2000]
+        job.locked_by = None
+        job.locked_until = None
+        if attempts >= max_attempts:
+            job.status = "failed"
+            changed = _mark_material_failed(db, material_id)
+            handoff_cache.discard(str(material_id))
+            logger.error(f"Material job {job_id} failed permanently after {attempts} attempts")
+        else:
+            job.status = "queued"
+            job.run_after = func.now() + timedelta(seconds=settings.MATERIAL_JOB_RETRY_BACKOFF_SECONDS * attempts)
+            changed = _set_material_status(db, material_id, {"status": "queued"})
+            logger.warning(f"Material job {job_id} attempt {attempts} failed, retrying")
+        db.commit()
+    if not changed:
+        # Failed after the material went ready; clients already have the result
+        return
+    if attempts >= max_attempts:
+        material_events.publish(material_id, "failed")
+    else:
+        material_events.publish(material_id, "queued", {"attempt": attempts + 1})
+
+def _extend_leases():
+    """Heartbeat: keep leases of jobs running in this process from expiring."""
+    with _stats_lock:
+        running = dict(_running_jobs)
+    if not running:
+        return
+    with SessionLocal() as db:
+        for job_id, worker_id in running.items():
+            db.query(MaterialJob).filter(
+                MaterialJob.id == job_id, MaterialJob.locked_by == worker_id
+            ).update({"locked_until": func.now() + _lease()}, synchronize_session=False)
+        db.commit()
+
+def reap_stuck_jobs():
     """
-    Worker thread that processes materials from the queue one by one.
+    Fail jobs whose lease expired on their last attempt, and re-enqueue
+    materials left in queued/processing without any job row.
+    Jobs with attempts left are simply re-claimed by _claim_job.
     """
-    logger.info("Material AI Worker Thread started.")
-    while not stop_event.is_set():
+    with SessionLocal() as db:
+        exhausted = (
+            db.query(MaterialJob)
+            .filter(
+                MaterialJob.status == "processing",
+                MaterialJob.locked_until < func.now(),
+                MaterialJob.attempts >= MaterialJob.max_attempts,
+            )
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        failed = []
+        for job in exhausted:
+            job.status = "failed"
+            job.last_error = job.last_error or "Visibility timeout expired"
+            job.locked_by = None
+            job.locked_until = None
+            if _mark_material_failed(db, job.material_id):
+                failed.append(job.material_id)
+            handoff_cache.discard(str(job.material_id))
+            logger.error(f"Reaped stuck material job {job.id}")
+        db.commit()
+        for material_id in failed:
+            material_events.publish(material_id, "failed")
+
+        orphaned = (
+            db.query(Material.id)
+            .filter(
+                Material.status.in_(("queued", "processing")),
+                Material.updated_at < func.now() - _lease(),
+                ~exists().where(MaterialJob.material_id == Material.id),
+            )
+            .all()
+        )
+        for (material_id,) in orphaned:
+            logger.warning(f"Re-enqueueing orphaned material {material_id}")
+            enqueue_material(material_id, db)
+
+# --- Worker Pool ---
+
+def _run_job(job_id: UUID, material_id: UUID, attempts: int, max_attempts: int, worker_id: str, slots: threading.BoundedSemaphore):
+    started = time.monotonic()
+    failed = False
+    with _stats_lock:
+        _stats["active_jobs"] += 1
+        _running_jobs[job_id] = worker_id
+    try:
+        logger.info(f"Worker {worker_id} picked up material: {material_id} (attempt {attempts})")
+        process_material_background(material_id)
+        _complete_job(job_id, worker_id)
+    except Exception as e:
+        failed = True
+        logger.error(f"Error in worker thread for material {material_id}: {e}")
         try:
-            # excessive blocking here is fine, it's a daemon thread
-            # timeout allows checking stop_event periodically
-            material_id = material_queue.get(timeout=1)
-            
+            _fail_job(job_id, material_id, worker_id, attempts, max_attempts, str(e))
+        except Exception as db_error:
+            # Lease will expire and the job becomes claimable again
+            logger.error(f"Failed to record failure for job {job_id}: {db_error}")
+    finally:
+        elapsed = time.monotonic() - started
+        with _stats_lock:
+            _running_jobs.pop(job_id, None)
+            _stats["active_jobs"] -= 1
+            _stats["jobs_processed"] += 1
+            _stats["jobs_failed"] += int(failed)
+            _stats["total_job_seconds"] += elapsed
+            _stats["last_job_seconds"] = elapsed
+        metrics.observe("material_job_seconds", elapsed, {"outcome": "error" if failed else "ok"})
+        logger.info(f"Material {material_id} finished in {elapsed:.1f}s")
+        slots.release()
+
+def worker(index: int = 0):
+    """
+    Worker thread that claims material jobs from Postgres.
+    Each worker runs up to MATERIAL_WORKER_MAX_IN_FLIGHT jobs at once.
+    """
+    worker_id = f"{_worker_prefix}:{index}"
+    logger.info(f"Material AI Worker Thread {worker_id} started.")
+    max_in_flight = max(1, settings.MATERIAL_WORKER_MAX_IN_FLIGHT)
+    slots = threading.BoundedSemaphore(max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"MaterialWorker-{index}")
+    try:
+        while not stop_event.is_set():
             try:
-                logger.info(f"Worker picked up material: {material_id}")
-                process_material_background(material_id)
+                # timeouts allow checking stop_event periodically
+                if not slots.acquire(timeout=1):
+                    continue
+                try:
+                    claimed = _claim_job(worker_id)
+                except Exception:
+                    # e.g. a DB failover; without this the slot is lost for good
+                    slots.release()
+                    raise
+                if not claimed:
+                    slots.release()
+                    wakeup_event.wait(settings.MATERIAL_JOB_POLL_INTERVAL_SECONDS)
+                    wakeup_event.clear()
+                    continue
+                executor.submit(_run_job, *claimed, worker_id, slots)
             except Exception as e:
-                logger.error(f"Error in worker thread for material {material_id}: {e}")
-            finally:
-                material_queue.task_done()
-                
-        except queue.Empty:
-            continue
+                logger.error(f"Unexpected error in worker loop: {e}")
+                time.sleep(1) # Prevent tight loop on crash
+    finally:
+        # Let in-flight jobs finish before the worker exits
+        executor.shutdown(wait=True)
+        logger.info(f"Material AI Worker Thread {worker_id} stopped.")
+
+def maintenance():
+    """Extend leases of local jobs and periodically reap stuck ones."""
+    heartbeat_interval = max(1, settings.MATERIAL_JOB_VISIBILITY_TIMEOUT_SECONDS // 3)
+    interval = min(heartbeat_interval, settings.MATERIAL_JOB_REAPER_INTERVAL_SECONDS)
+    last_reap = 0.0
+    while not stop_event.wait(interval):
+        try:
+            _extend_leases()
+            if time.monotonic() - last_reap >= settings.MATERIAL_JOB_REAPER_INTERVAL_SECONDS:
+                reap_stuck_jobs()
+                last_reap = time.monotonic()
         except Exception as e:
-            logger.error(f"Unexpected error in worker loop: {e}")
-            time.sleep(1) # Prevent tight loop on crash
+            logger.error(f"Material job maintenance failed: {e}")
 
 def start_worker():
-    t = threading.Thread(target=worker, daemon=True, name="MaterialWorker")
+    stop_event.clear()
+    count = settings.MATERIAL_WORKER_COUNT
+    if count <= 0:
+        logger.info("MATERIAL_WORKER_COUNT is 0; this process only enqueues material jobs.")
+        return []
+    for index in range(count):
+        t = threading.Thread(target=worker, args=(index,), daemon=True, name=f"MaterialWorker-{index}")
+        t.start()
+        _workers.append(t)
+    t = threading.Thread(target=maintenance, daemon=True, name="MaterialJobMaintenance")
     t.start()
-    return t
+    _workers.append(t)
+    return list(_workers)
 
-def stop_worker():
+def stop_worker(timeout: float | None = None):
+    """Stop claiming new jobs and wait for running ones to finish."""
     stop_event.set()
+    wakeup_event.set()
+    if timeout is None:
+        timeout = settings.MATERIAL_WORKER_SHUTDOWN_TIMEOUT_SECONDS
+    deadline = time.monotonic() + timeout
+    for t in _workers:
+        t.join(max(0.0, deadline - time.monotonic()))
+        if t.is_alive():
+            # Its jobs' leases stop being extended and will be re-claimed elsewhere
+            logger.warning(f"{t.name} still running jobs after shutdown timeout")
+    _workers[:] = [t for t in _workers if t.is_alive()]
+
+def enqueue_material(material_id: UUID, db: Session | None = None):
+    """Insert (or reset) the durable job row for a material."""
+    stmt = insert(MaterialJob).values(
+        material_id=material_id,
+        status="queued",
+        attempts=0,
+        max_attempts=settings.MATERIAL_JOB_MAX_ATTEMPTS,
+    ).on_conflict_do_update(
+        index_elements=[MaterialJob.material_id],
+        set_={
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": settings.MATERIAL_JOB_MAX_ATTEMPTS,
+            "run_after": func.now(),
+            "locked_by": None,
+            "locked_until": None,
+            "last_error": None,
+        },
+    )
+    if db is None:
+        with SessionLocal() as own_db:
+            own_db.execute(stmt)
+            own_db.commit()
+    else:
+        db.execute(stmt)
+        db.commit()
+    wakeup_event.set()
+    logger.info(f"Enqueued material {material_id} for processing.")
 
-def enqueue_material(material_id: UUID):
-    material_queue.put(material_id)
-    logger.info(f"Enqueued material {material_id} for processing. Queue size: {material_queue.qsize()}")
+def get_queue_stats() -> dict:
+    with SessionLocal() as db:
+        counts = dict(
+            db.query(MaterialJob.status, func.count(MaterialJob.id))
+            .filter(MaterialJob.status.in_(("queued", "processing")))
+            .group_by(MaterialJob.status)
+            .all()
+        )
+    with _stats_lock:
+        processed = _stats["jobs_processed"]
+        return {
+            "queue_depth": counts.get("queued", 0),
+            "processing_jobs": counts.get("processing", 0),
+            "workers": sum(1 for t in _workers if t.is_alive() and t.name.startswith("MaterialWorker")),
+            "max_in_flight_per_worker": settings.MATERIAL_WORKER_MAX_IN_FLIGHT,
+            "active_jobs": _stats["active_jobs"],
+            "jobs_processed": processed,
+            "jobs_failed": _stats["jobs_failed"],
+            "last_job_seconds": _stats["last_job_seconds"],
+            "avg_job_seconds": (_stats["total_job_seconds"] / processed) if processed else None,
+        }
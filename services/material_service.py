@@ -1,14 +1,19 @@
 import logging
-import io
+import threading
 import uuid
 from typing import List, Optional
-from PIL import Image
 from sqlalchemy.orm import Session
 
 from models.material import Material
-from models.material_way import MaterialWay
-from services.ai.gemini_material import gemini_material
+from services.ai.gemini_material import ReferenceImage, gemini_material
+from services.handoff_cache import handoff_cache
+from services.image_processing import build_variants, extension_for, image_pool, load_upload, resize_and_encode, sniff_content_type
+from services.material_events import material_events
+from services.material_store import WAY_STAGE, MaterialPipelineStore
+from services.pipeline import Stage, StageGraph
 from services.storage import r2_storage
+from services.storage_gc import material_prefix, record_deletions
+from core.config import settings
 from core.database import SessionLocal
 
 logger = logging.getLogger(__name__)
@@ -41,42 +46,52 @@ def update_material(db: Session, material_id: uuid.UUID, owner_id: uuid.UUID, ti
     return material
 
 def delete_material(db: Session, material_id: uuid.UUID, owner_id: uuid.UUID) -> bool:
-    """Delete material from DB and associated assets from R2."""
+    """Delete material from DB; its R2 folder is tombstoned for the storage collector."""
     material = get_material(db, material_id, owner_id)
     if not material:
         return False
-    
-    # Cascade delete R2 folder
-    try:
-        r2_storage.delete_folder(f"materials/{material_id}/")
-    except Exception as e:
-        logger.error(f"Failed to cleanup R2 storage for material {material_id}: {e}")
-    
+
+    record_deletions(db, [material_prefix(material_id)])
     db.delete(material)
     db.commit()
     return True
 
 # --- Pipeline Operations ---
 
+def _reference_key(material_id: uuid.UUID) -> str:
+    return f"materials/{material_id}/reference.{extension_for(settings.IMAGE_OUTPUT_FORMAT)}"
+
 def create_initial_material(title: str, image_bytes: bytes, content_type: str, owner_id: uuid.UUID, db: Session) -> Material:
-    """Create the initial material record and upload the original image."""
+    """
+    Create the initial material record and upload the original image.
+    The upload is normalized into two copies sized for their purpose: the
+    stored original and a smaller AI reference sent to Gemini.
+    """
     try:
-        # Standardize input image to PNG
         try:
-            img = Image.open(io.BytesIO(image_bytes))
-            buf = io.BytesIO()
-            img.save(buf, format="PNG")
-            image_bytes = buf.getvalue()
-            content_type = "image/png"
-        except Exception as e:
-            logger.error(f"Image conversion to PNG failed: {e}")
-            raise ValueError("Invalid image format")
+            img = load_upload(image_bytes, max_edge=settings.ORIGINAL_IMAGE_MAX_EDGE)
+        except ValueError as e:
+            logger.error(f"Image decoding failed: {e}")
+            raise
+        original = resize_and_encode(
+            img, settings.ORIGINAL_IMAGE_MAX_EDGE, settings.IMAGE_OUTPUT_FORMAT, settings.IMAGE_OUTPUT_QUALITY
+        )
+        reference = resize_and_encode(
+            img, settings.AI_REFERENCE_IMAGE_MAX_EDGE, settings.IMAGE_OUTPUT_FORMAT, settings.AI_REFERENCE_IMAGE_QUALITY
+        )
 
         material_id = uuid.uuid4()
         
-        # Upload original image to R2
-        original_key = f"materials/{material_id}/original.png"
-        original_url = r2_storage.upload_bytes(original_key, image_bytes, content_type)
+        # Upload original and AI reference images to R2 side by side
+        original_key = f"materials/{material_id}/original.{original.extension}"
+        original_url, _ = r2_storage.upload_many([
+            (original_key, original.data, original.content_type),
+            (_reference_key(material_id), reference.data, reference.content_type),
+        ])
+        # Hand the reference straight to a local worker so it can skip the R2
+        # download; enqueue-only nodes would never read or discard the entry
+        if settings.MATERIAL_WORKER_COUNT > 0:
+            handoff_cache.put(str(material_id), reference.data)
         
         material = Material(
             id=material_id,
@@ -94,109 +109,293 @@ def create_initial_material(title: str, image_bytes: bytes, content_type: str, o
         logger.error(f"Initial material creation failed: {e}")
         raise
 
+class _JobReference:
+    """
+    The job's AI reference image, fetched (hand-off, then R2) and uploaded to
+    the Gemini Files API on first use. A run whose Gemini stages are all
+    checkpointed never fetches or uploads it.
+    """
+
+    def __init__(self, material_id: uuid.UUID):
+        self.material_id = material_id
+        self._reference: Optional[ReferenceImage] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ReferenceImage:
+        with self._lock:
+            if self._reference is None:
+                image_bytes = handoff_cache.get(str(self.material_id))
+                if image_bytes is None:
+                    image_bytes = r2_storage.download_file_bytes(_reference_key(self.material_id))
+                if not image_bytes:
+                    raise Exception("Reference image missing in R2")
+                # Uploaded once and referenced by URI from every later call
+                self._reference = gemini_material.upload_reference(
+                    image_bytes, sniff_content_type(image_bytes), f"material-{self.material_id}"
+                )
+            return self._reference
+
+    def release(self):
+        with self._lock:
+            if self._reference is not None:
+                gemini_material.release_reference(self._reference)
+                self._reference = None
+
+def _upload_variants(key_base: str, data: bytes) -> dict:
+    """Store responsive derivatives next to an image; returns its variants and placeholder."""
+    variants, placeholder = image_pool.run(
+        build_variants,
+        data,
+        settings.IMAGE_VARIANT_WIDTHS,
+        settings.IMAGE_OUTPUT_FORMAT,
+        settings.IMAGE_VARIANT_QUALITY,
+        settings.IMAGE_PLACEHOLDER_WIDTH,
+    )
+    uris = r2_storage.upload_many(
+        (f"{key_base}-w{variant.width}.{variant.extension}", variant.data, variant.content_type)
+        for variant in variants
+    )
+    return {
+        "variants": [
+            {"width": variant.width, "height": variant.height, "uri": uri}
+            for variant, uri in zip(variants, uris)
+        ],
+        "placeholder": placeholder,
+    }
+
+def _generated_image(generated: dict, stage: str, results) -> bytes:
+    """Bytes produced by an image stage of this run; a resumed run only has its checkpointed URL."""
+    data = generated.get(stage)
+    if data is None:
+        data = r2_storage.download_file_bytes(r2_storage.key_for_url(results[stage]))
+    return data
+
+def _build_material_graph(
+    material_id: uuid.UUID, title: str, reference: _JobReference, generated: dict
+) -> StageGraph:
+    """
+    Describe the pipeline as a graph of stages.
+    The material cover only needs the description, and every way's cover and
+    guide only need the ways JSON, so they all run side by side. With
+    MATERIAL_COMBINED_ANALYSIS the description and ways come from one call.
+    Image stages leave their bytes in `generated` for the variants graph.
+    """
+
+    def describe(results):
+        return gemini_material.describe_material(reference.get())
+
+    def generate_ways(results):
+        return gemini_material.generate_ways_json(reference.get(), results["description"])
+
+    def generate_cover(results):
+        description = results["description"]
+        cover_prompt = (
+            f"A high-quality, realistic, and professional cover photo representing: {title}. "
+            f"The image should look like a product showcase or an editorial photo. "
+            f"Please include the word '{title}' as clean, modern typography in the center or bottom of the image. "
+            f"Context: {description[:200]}"
+        )
+        cover = gemini_material.generate_image(cover_prompt, reference.get())
+        cover_key = f"materials/{material_id}/cover.{cover.extension}"
+        uri = r2_storage.upload_bytes(cover_key, cover.data, cover.content_type)
+        generated["cover"] = cover.data
+        return uri
+
+
+    def expand_ways(ways_data):
+        stages = []
+        for index, way_item in enumerate(ways_data):
+            stages.extend(_build_way_stages(material_id, title, reference, index, way_item, generated))
+        return stages
+
+    if settings.MATERIAL_COMBINED_ANALYSIS:
+        # One multimodal call yields both; description/ways are derived from it
+        # so checkpoints, events and downstream stages are unchanged
+        def analyze(results):
+            return gemini_material.analyze_material(reference.get())
+
+        analysis_stages = [
+            Stage("analysis", analyze, model=gemini_material.text_model),
+            Stage("description", lambda results: results["analysis"]["description"], deps=("analysis",)),
+            Stage("ways", lambda results: results["analysis"]["ways"], deps=("analysis",), expand=expand_ways),
+        ]
+    else:
+        analysis_stages = [
+            Stage("description", describe, model=gemini_material.text_model),
+            Stage("ways", generate_ways, deps=("description",), expand=expand_ways, model=gemini_material.text_model),
+        ]
+
+    return StageGraph(
+        [
+            *analysis_stages,
+            Stage("cover", generate_cover, deps=("description",), model=gemini_material.img_model),
+        ],
+        max_workers=settings.MATERIAL_PIPELINE_MAX_PARALLEL,
+    )
+
+def _build_way_stages(
+    material_id: uuid.UUID, title: str, reference: _JobReference, index: int, way_item: dict, generated: dict
+) -> List[Stage]:
+    """Fan out one way into independent cover/guide stages plus a join stage."""
+    prefix = f"way:{index}"
+    # Deterministic so a resumed run reuses the same R2 keys
+    way_id = uuid.uuid5(material_id, prefix)
+    way_title = way_item.get("title", "Untitled Project")
+    way_desc = way_item.get("description", "")
+    way_img_prompt = way_item.get("img_prompt", "")
+
+    def generate_way_cover(results):
+        way_cover = gemini_material.generate_image(way_img_prompt, reference.get())
+        way_cover_key = f"materials/{material_id}/{way_id}/cover.{way_cover.extension}"
+        uri = r2_storage.upload_bytes(way_cover_key, way_cover.data, way_cover.content_type)
+        generated[f"{prefix}:image"] = way_cover.data
+        return uri
+
+    def generate_way_guide(results):
+        return gemini_material.generate_step_guide(
+            reference.get(), title, results["description"], way_title, way_desc
+        )
+
+    def join_way(results):
+        return {
+            "id": str(way_id),
+            "title": way_title,
+            "description": way_desc,
+            "image_uri": results[f"{prefix}:image"],
+            "md": results[f"{prefix}:guide"],
+        }
+
+    return [
+        Stage(f"{prefix}:image", generate_way_cover, model=gemini_material.img_model),
+        Stage(f"{prefix}:guide", generate_way_guide, model=gemini_material.text_model),
+        Stage(prefix, join_way, deps=(f"{prefix}:image", f"{prefix}:guide")),
+    ]
+
+def _build_variants_graph(material_id: uuid.UUID, results: dict, generated: dict, original_image_uri: Optional[str]) -> StageGraph:
+    """
+    Derivatives of every stored image, run after the material is ready.
+    Best effort: a failed stage is logged and yields None, leaving that row
+    without variants (clients fall back to image_uri).
+    """
+
+    def variants_of(key_base: str, load):
+        def run(_results):
+            try:
+                return _upload_variants(key_base, load())
+            except Exception as e:
+                logger.warning(f"Image variants failed for {key_base}: {e}")
+                return None
+        return run
+
+    stages = [
+        Stage("cover:variants", variants_of(
+            f"materials/{material_id}/cover", lambda: _generated_image(generated, "cover", results)
+        )),
+    ]
+    if original_image_uri:
+        stages.append(Stage("original:variants", variants_of(
+            f"materials/{material_id}/original",
+            lambda: r2_storage.download_file_bytes(r2_storage.key_for_url(original_image_uri)),
+        )))
+    for name, way in results.items():
+        if WAY_STAGE.match(name):
+            stages.append(Stage(f"{name}:variants", variants_of(
+                f"materials/{material_id}/{way['id']}/cover",
+                lambda name=name: _generated_image(generated, f"{name}:image", results),
+            )))
+    return StageGraph(stages, max_workers=settings.MATERIAL_PIPELINE_MAX_PARALLEL)
+
+def _publish_stage_event(material_id: uuid.UUID, stage: str, result, db: Session):
+    """Push user-visible stage transitions to SSE subscribers, notifying on the job's connection."""
+    if stage == "description":
+        material_events.publish(material_id, "description_ready", {"description": result}, db=db)
+    elif stage == "cover":
+        material_events.publish(material_id, "cover_ready", {"image_uri": result}, db=db)
+    elif match := WAY_STAGE.match(stage):
+        material_events.publish(
+            material_id,
+            "way_ready",
+            {"index": int(match.group(1)), "id": result["id"], "title": result["title"], "image_uri": result["image_uri"]},
+            db=db,
+        )
+
 def process_material_background(material_id: uuid.UUID):
     """
     Background worker task to orchestrate the AI pipeline.
     Decoupled from request-response cycle.
+    Every finished stage is checkpointed; on failure the error is raised to the
+    job queue, which retries and resumes from the first incomplete stage.
     """
-    owner_id = None
     try:
         logger.info(f"Starting background processing for material {material_id}")
         
-        # 1. Update status to 'processing' and fetch metadata
-        with SessionLocal() as db:
-            material = db.query(Material).filter(Material.id == material_id).first()
+        # One session for the whole job; stage callbacks run on this thread
+        with SessionLocal(expire_on_commit=False) as db:
+            store = MaterialPipelineStore(db, material_id)
+
+            # 1. Update status to 'processing' and fetch metadata
+            material = store.start()
             if not material:
                 logger.error(f"Material {material_id} not found in background task")
                 return
-            
-            material.status = "processing"
-            db.commit()
-            owner_id = material.owner_id
-            title = material.title
-
-        # 2. Download original image for AI context
-        original_key = f"materials/{material_id}/original.png"
-        image_bytes = r2_storage.download_file_bytes(original_key)
-        if not image_bytes:
-             raise Exception("Original image missing in R2")
-        
-        content_type = "image/png" 
+            if material.status == "ready":
+                logger.info(f"Material {material_id} is already ready, completing its job")
+                handoff_cache.discard(str(material_id))
+                return
 
-        # 3. Step: Description
-        description = gemini_material.describe_material(image_bytes, content_type)
-        with SessionLocal() as db:
-            m = db.query(Material).filter(Material.id == material_id).first()
-            if m:
-                m.description = description
-                db.commit()
+            material_events.publish(material_id, "processing", db=db)
 
-        # 4. Step: Generate Upcycling Projects (Ways)
-        ways_data = gemini_material.generate_ways_json(image_bytes, content_type, description)
+            # 2. Run the stage graph: description -> (cover || ways -> per-way cover/guide).
+            # The AI reference image is fetched and uploaded by the first stage needing it
+            reference = _JobReference(material_id)
+            try:
+                completed = store.load_checkpoints()
+                if completed:
+                    logger.info(f"Resuming material {material_id} from {len(completed)} checkpointed stages")
 
-        # 5. Step: Generate Material Cover Photo
-        cover_prompt = (
-            f"A high-quality, realistic, and professional cover photo representing: {title}. "
-            f"The image should look like a product showcase or an editorial photo. "
-            f"Please include the word '{title}' as clean, modern typography in the center or bottom of the image. "
-            f"Context: {description[:200]}"
-        )
-        material_cover_bytes = gemini_material.generate_image(cover_prompt, image_bytes, content_type)
-        
-        cover_key = f"materials/{material_id}/cover.png"
-        cover_url = r2_storage.upload_bytes(cover_key, material_cover_bytes, "image/png")
-        
-        with SessionLocal() as db:
-            m = db.query(Material).filter(Material.id == material_id).first()
-            if m:
-                m.image_uri = cover_url
-                db.commit()
-
-        # 6. Step: Process each recycling way
-        for way_item in ways_data:
-            way_id = uuid.uuid4()
-            way_title = way_item.get("title", "Untitled Project")
-            way_desc = way_item.get("description", "")
-            way_img_prompt = way_item.get("img_prompt", "")
-
-            # Generate project cover
-            way_cover_bytes = gemini_material.generate_image(way_img_prompt, image_bytes, content_type)
-            way_cover_key = f"materials/{material_id}/{way_id}/cover.png"
-            way_cover_url = r2_storage.upload_bytes(way_cover_key, way_cover_bytes, "image/png")
-
-            # Generate project guide
-            guide_md = gemini_material.generate_step_guide(
-                image_bytes, content_type, title, description, way_title, way_desc
-            )
-
-            with SessionLocal() as db:
-                way = MaterialWay(
-                    id=way_id,
-                    material_id=material_id,
-                    owner_id=owner_id,
-                    title=way_title,
-                    description=way_desc,
-                    image_uri=way_cover_url,
-                    md=guide_md
-                )
-                db.add(way)
-                db.commit()
-        
-        # 7. Success
-        with SessionLocal() as db:
-            m = db.query(Material).filter(Material.id == material_id).first()
-            if m:
-                m.status = "ready"
-                db.commit()
+                def on_stage_complete(stage: str, result):
+                    store.save_stage(stage, result)
+                    _publish_stage_event(material_id, stage, result, db)
+
+                generated: dict[str, bytes] = {}
+                graph = _build_material_graph(material_id, material.title, reference, generated)
+                results = graph.run(on_complete=on_stage_complete, completed=completed)
+            finally:
+                reference.release()
+            
+            # 3. Success: persist all ways at once, checkpoints are no longer needed
+            store.complete(results)
+            material_events.publish(material_id, "ready", db=db)
+
+            # 4. Responsive variants off the time-to-ready path, saved as they finish.
+            # The material is already ready, so a failure here must not fail the job
+            def on_variants_complete(stage: str, result):
+                if result is not None:
+                    store.save_variants(stage, result, results)
+
+            try:
+                variants = _build_variants_graph(material_id, results, generated, material.original_image_uri)
+                variants.run(on_complete=on_variants_complete)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Image variants failed for ready material {material_id}: {e}")
+        handoff_cache.discard(str(material_id))
             
         logger.info(f"Successfully processed material {material_id}")
 
     except Exception as e:
         logger.error(f"Material pipeline failed for {material_id}: {e}")
-        # Cleanup broken state to avoid leaving junk records
-        if owner_id:
-            with SessionLocal() as db:
-                delete_material(db, material_id, owner_id)
-                logger.info(f"Cleaned up failed material {material_id}")
-        else:
-            logger.error(f"Cannot cleanup material {material_id} - metadata missing")
+        raise
+
+def retry_material(db: Session, material_id: uuid.UUID, owner_id: uuid.UUID) -> Optional[Material]:
+    """Reset a failed material so it can be re-enqueued; checkpoints are kept."""
+    material = get_material(db, material_id, owner_id)
+    if not material:
+        return None
+    if material.status != "failed":
+        raise ValueError("Only failed materials can be retried")
+    material.status = "queued"
+    material.error_message = None
+    db.commit()
+    db.refresh(material)
+    return material
@@ -0,0 +1,107 @@
+import re
+import uuid
+from typing import Any, Optional
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models.material import Material
+from models.material_checkpoint import MaterialCheckpoint
+from models.material_way import MaterialWay
+
+# Join stage of a single way ("way:0"), as opposed to its sub-stages ("way:0:image")
+WAY_STAGE = re.compile(r"^way:(\d+)$")
+
+
+class MaterialPipelineStore:
+    """
+    Persistence for one pipeline job on a single DB session.
+    The material row is loaded once and updated in place, each stage output is
+    checkpointed as it finishes, and all ways are bulk-inserted at the end.
+    Open the session with expire_on_commit=False so commits don't trigger
+    reloads of the material row.
+    """
+
+    def __init__(self, db: Session, material_id: uuid.UUID):
+        self.db = db
+        self.material_id = material_id
+        self.material: Optional[Material] = None
+
+    def start(self) -> Optional[Material]:
+        """
+        Load the material and mark it processing. A material that is already
+        ready (a reclaimed job whose worker died after complete()) is returned
+        untouched so the caller can finish the job without regenerating it.
+        """
+        self.material = self.db.get(Material, self.material_id)
+        if not self.material or self.material.status == "ready":
+            return self.material
+        self.material.status = "processing"
+        self.material.error_message = None
+        self.db.commit()
+        return self.material
+
+    def load_checkpoints(self) -> dict[str, Any]:
+        rows = (
+            self.db.query(MaterialCheckpoint.stage, MaterialCheckpoint.payload)
+            .filter(MaterialCheckpoint.material_id == self.material_id)
+            .all()
+        )
+        return {stage: payload for stage, payload in rows}
+
+    def save_stage(self, stage: str, result: Any):
+        """Checkpoint a finished stage; committed right away so a retry can resume from it."""
+        self.db.execute(
+            insert(MaterialCheckpoint)
+            .values(material_id=self.material_id, stage=stage, payload=result)
+            .on_conflict_do_update(
+                constraint="uq_material_checkpoint_stage",
+                set_={"payload": result},
+            )
+        )
+        if stage == "description":
+            self.material.description = result
+        elif stage == "cover":
+            self.material.image_uri = result
+        self.db.commit()
+
+    def complete(self, results: dict[str, Any]):
+        """Insert every way in one statement, drop checkpoints and mark the material ready."""
+        way_stages = sorted(
+            (int(match.group(1)), name)
+            for name in results
+            if (match := WAY_STAGE.match(name))
+        )
+        rows = [
+            {
+                "id": uuid.UUID(results[name]["id"]),
+                "material_id": self.material_id,
+                "owner_id": self.material.owner_id,
+                "title": results[name]["title"],
+                "description": results[name]["description"],
+                "image_uri": results[name]["image_uri"],
+                "md": results[name]["md"],
+            }
+            for _, name in way_stages
+        ]
+        if rows:
+            self.db.execute(insert(MaterialWay).on_conflict_do_nothing(), rows)
+        self.db.query(MaterialCheckpoint).filter(MaterialCheckpoint.material_id == self.material_id).delete(
+            synchronize_session=False
+        )
+        self.material.status = "ready"
+        self.db.commit()
+
+    def save_variants(self, stage: str, result: dict[str, Any], results: dict[str, Any]):
+        """Attach image derivatives once the material is ready (see _build_variants_graph)."""
+        if stage == "cover:variants":
+            self.material.image_variants = result["variants"]
+            self.material.image_placeholder = result["placeholder"]
+        elif stage == "original:variants":
+            self.material.original_image_variants = result["variants"]
+        else:
+            way_id = uuid.UUID(results[stage.removesuffix(":variants")]["id"])
+            self.db.query(MaterialWay).filter(MaterialWay.id == way_id).update(
+                {"image_variants": result["variants"], "image_placeholder": result["placeholder"]},
+                synchronize_session=False,
+            )
+        self.db.commit()
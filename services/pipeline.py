@@ -0,0 +1,143 @@
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from core.logging import logger
+from core.metrics import metrics
+
+
+@dataclass
+class Stage:
+    """
+    A single unit of pipeline work.
+    `run` receives a snapshot of the results of every stage finished so far.
+    `expand` optionally fans out: it receives this stage's result and returns
+    new stages to add to the graph (e.g. one stage per generated way).
+    `model` labels the stage's latency metrics with the AI model it calls.
+    """
+    name: str
+    run: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+    expand: Optional[Callable[[Any], Iterable["Stage"]]] = None
+    model: str = ""
+
+    @property
+    def kind(self) -> str:
+        """Stage name without fan-out indices ("way:2:image" -> "way:image"), used as a metric label."""
+        return re.sub(r":\d+", "", self.name)
+
+
+class StageFailed(Exception):
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageGraph:
+    """
+    Runs stages as soon as their dependencies are satisfied, with independent
+    stages executing concurrently on a bounded thread pool.
+    Completion callbacks always run on the calling thread, so they may safely
+    touch non thread-safe resources such as a DB session.
+    Results passed as `completed` (checkpoints from an earlier run) are reused
+    instead of re-running their stages.
+    """
+
+    def __init__(self, stages: Iterable[Stage] = (), max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+        self._stages: Dict[str, Stage] = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage: Stage):
+        if stage.name in self._stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        self._stages[stage.name] = stage
+
+    @staticmethod
+    def _run_timed(stage: Stage, results: Dict[str, Any]) -> Any:
+        labels = {"stage": stage.kind, "model": stage.model or "none"}
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return stage.run(results)
+        except Exception:
+            outcome = "error"
+            metrics.inc("pipeline_stage_failures", labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("pipeline_stage_seconds", elapsed, labels)
+            logger.info(
+                "Pipeline stage finished",
+                extra={"stage": stage.name, "stage_kind": stage.kind, "model": labels["model"],
+                       "outcome": outcome, "duration_ms": round(elapsed * 1000)},
+            )
+
+    def _expand(self, stage: Stage, result: Any, pending: Dict[str, Stage]):
+        if not stage.expand:
+            return
+        for child in stage.expand(result):
+            self.add(child)
+            pending[child.name] = child
+
+    def run(
+        self,
+        on_complete: Optional[Callable[[str, Any], None]] = None,
+        completed: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        completed = completed or {}
+        results: Dict[str, Any] = {}
+        pending: Dict[str, Stage] = dict(self._stages)
+        running: Dict[Future, Stage] = {}
+        failure: Optional[StageFailed] = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="PipelineStage") as executor:
+            while pending or running:
+                # Stop scheduling once something failed; just drain what is in flight.
+                progressed = failure is None
+                while progressed:
+                    progressed = False
+                    for name, stage in list(pending.items()):
+                        if not all(dep in results for dep in stage.deps):
+                            continue
+                        del pending[name]
+                        if name in completed:
+                            # Resume: reuse the checkpoint, but still fan out from it
+                            results[name] = completed[name]
+                            self._expand(stage, results[name], pending)
+                            progressed = True
+                        else:
+                            running[executor.submit(self._run_timed, stage, dict(results))] = stage
+
+                if not pending and not running:
+                    break
+
+                if not running:
+                    if failure is None:
+                        blocked = ", ".join(sorted(pending))
+                        raise ValueError(f"Unresolvable stage dependencies: {blocked}")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Pipeline stage {stage.name} failed: {e}")
+                        if failure is None:
+                            failure = StageFailed(stage.name, e)
+                        continue
+
+                    results[stage.name] = result
+                    if on_complete:
+                        on_complete(stage.name, result)
+                    if failure is None:
+                        self._expand(stage, result, pending)
+
+        if failure is not None:
+            raise failure
+        return results
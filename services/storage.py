@@ -1,78 +1,179 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 from core.config import settings
+from core.metrics import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
+# S3 DeleteObjects accepts at most this many keys per request
+DELETE_BATCH_SIZE = 1000
+
+
 class R2Storage:
     def __init__(self):
         self.bucket_name = settings.R2_BUCKET
         self.public_base_url = settings.R2_PUBLIC_URL
-        
+        self.transfer_concurrency = max(1, settings.R2_TRANSFER_CONCURRENCY)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+        # boto3 clients are thread-safe; one client with a pool large enough
+        # for the pipeline's parallel stages plus bulk transfers
         self.s3 = boto3.client(
             "s3",
             endpoint_url=settings.R2_ENDPOINT_URL,
             aws_access_key_id=settings.R2_ACCESS_KEY_ID,
             aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
-            config=Config(signature_version="s3v4"),
+            config=Config(
+                signature_version="s3v4",
+                max_pool_connections=settings.R2_MAX_POOL_CONNECTIONS,
+                retries={"total_max_attempts": settings.R2_MAX_ATTEMPTS, "mode": "standard"},
+                connect_timeout=settings.R2_CONNECT_TIMEOUT_SECONDS,
+                read_timeout=settings.R2_READ_TIMEOUT_SECONDS,
+                tcp_keepalive=settings.R2_TCP_KEEPALIVE,
+            ),
             region_name="auto",
         )
 
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.transfer_concurrency, thread_name_prefix="R2Transfer")
+            return self._executor
+
+    def _request(self, op: str, fn: Callable[..., dict], **kwargs) -> dict:
+        """One S3 call, timed per operation, with botocore's retries counted."""
+        labels = {"op": op}
+        try:
+            with metrics.timer("r2_request_seconds", labels):
+                response = fn(**kwargs)
+        except ClientError as e:
+            retries = e.response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+            if retries:
+                metrics.inc("r2_retries", labels, retries)
+            metrics.inc("r2_errors", labels)
+            raise
+        except Exception:
+            metrics.inc("r2_errors", labels)
+            raise
+        retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if retries:
+            metrics.inc("r2_retries", labels, retries)
+        return response
+
+    def public_url(self, key: str) -> str:
+        return f"{self.public_base_url}/{key}"
+
     def upload_bytes(self, key: str, data: bytes, content_type: str = "image/png") -> str:
         """
         Uploads bytes to R2 and returns the public URL (assuming standardized public access).
         """
         try:
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                Body=data,
-                ContentType=content_type,
-            )
+            self._request("put", self.s3.put_object, Bucket=self.bucket_name, Key=key, Body=data, ContentType=content_type)
             # Assuming standard structure for public access if configured
-            return f"{self.public_base_url}/{key}"
+            return self.public_url(key)
         except Exception as e:
             logger.error(f"Failed to upload to R2: {e}")
             raise e
 
+    def upload_many(self, items: Iterable[tuple[str, bytes, str]]) -> list[str]:
+        """
+        Upload (key, data, content_type) items concurrently; returns their
+        public URLs in order. Every upload is attempted, then the first
+        failure (if any) is raised.
+        """
+        items = list(items)
+        if len(items) <= 1:
+            return [self.upload_bytes(*item) for item in items]
+        futures = [self._pool().submit(self.upload_bytes, *item) for item in items]
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+    def key_for_url(self, url: str) -> str:
+        """Inverse of the public URL returned by upload_bytes."""
+        prefix = f"{self.public_base_url}/"
+        if not url.startswith(prefix):
+            raise ValueError(f"Not an R2 public URL: {url}")
+        return url[len(prefix):]
+
     def download_file_bytes(self, key: str) -> bytes | None:
         """Downloads file content as bytes directly from S3/R2."""
         if not self.s3:
             return None
         
         try:
-            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
-            return response['Body'].read()
+            with metrics.timer("r2_request_seconds", {"op": "get"}):
+                response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+                data = response['Body'].read()
+            retries = response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+            if retries:
+                metrics.inc("r2_retries", {"op": "get"}, retries)
+            return data
         except Exception as e:
+            metrics.inc("r2_errors", {"op": "get"})
             logger.error(f"Failed to download {key}: {e}")
             raise e
 
-    def delete_folder(self, prefix: str):
-        """
-        Deletes all objects with the given prefix (simulating folder deletion).
-        """
+    def _delete_batch(self, keys: list[str]) -> list[str]:
         try:
-            # List all objects with the prefix
-            paginator = self.s3.get_paginator('list_objects_v2')
-            pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
-
-            delete_us = []
-            for page in pages:
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        delete_us.append({'Key': obj['Key']})
-            
-            # Delete in batches (though delete_objects handles up to 1000)
-            if delete_us:
-                # Simple batching if > 1000 needed, but for now assuming small folder
-                self.s3.delete_objects(
-                    Bucket=self.bucket_name,
-                    Delete={'Objects': delete_us}
-                )
+            response = self._request(
+                "delete",
+                self.s3.delete_objects,
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
         except Exception as e:
-            logger.error(f"Failed to delete folder {prefix}: {e}")
-            # Don't raise, just log. Deletion failure shouldn't block DB delete.
+            logger.error(f"Failed to delete {len(keys)} objects from R2: {e}")
+            return keys
+        return [error["Key"] for error in response.get("Errors", [])]
+
+    def delete_keys(self, keys: Iterable[str]) -> list[str]:
+        """
+        Delete objects in batches of up to 1000 keys, batches in parallel.
+        Returns the keys that could not be deleted; never raises.
+        """
+        keys = list(dict.fromkeys(keys))
+        batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+        if len(batches) <= 1:
+            results = [self._delete_batch(batch) for batch in batches]
+        else:
+            results = list(self._pool().map(self._delete_batch, batches))
+        failed = [key for batch in results for key in batch]
+        if failed:
+            logger.warning(f"{len(failed)} of {len(keys)} R2 deletes failed")
+        return failed
+
+    def list_keys(self, prefix: str) -> list[str]:
+        """All keys under a prefix, following pagination."""
+        paginator = self.s3.get_paginator('list_objects_v2')
+        keys = []
+        with metrics.timer("r2_request_seconds", {"op": "list"}):
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return keys
+
+    # Async wrappers: the boto3 calls run on worker threads, off the event loop
+
+    async def upload_bytes_async(self, key: str, data: bytes, content_type: str = "image/png") -> str:
+        return await asyncio.to_thread(self.upload_bytes, key, data, content_type)
+
+    async def upload_many_async(self, items: Iterable[tuple[str, bytes, str]]) -> list[str]:
+        return await asyncio.to_thread(self.upload_many, list(items))
+
+    async def download_file_bytes_async(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self.download_file_bytes, key)
+
+    async def delete_keys_async(self, keys: Iterable[str]) -> list[str]:
+        return await asyncio.to_thread(self.delete_keys, list(keys))
 
 
 r2_storage = R2Storage()
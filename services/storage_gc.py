@@ -0,0 +1,128 @@
+import logging
+import threading
+from datetime import timedelta
+from typing import Iterable, Optional
+from uuid import UUID
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from core.config import settings
+from core.database import SessionLocal
+from core.metrics import metrics
+from models.storage_tombstone import StorageTombstone
+from services.storage import r2_storage
+
+logger = logging.getLogger(__name__)
+
+# Deleting a material or account only writes tombstones (an outbox) in the
+# same transaction; the collector thread lists the prefixes and deletes their
+# objects in 1000-key batches that span prefixes, retrying with backoff.
+stop_event = threading.Event()
+_collector: Optional[threading.Thread] = None
+
+
+def material_prefix(material_id: UUID) -> str:
+    return f"materials/{material_id}/"
+
+
+def record_deletions(db: Session, prefixes: Iterable[str]):
+    """Queue prefixes for deletion; committed by the caller with the DB delete."""
+    db.add_all(StorageTombstone(prefix=prefix) for prefix in prefixes)
+
+
+def _claim(limit: int) -> list[tuple[UUID, str]]:
+    with SessionLocal() as db:
+        now = func.now()
+        rows = (
+            db.query(StorageTombstone)
+            .filter(
+                StorageTombstone.run_after <= now,
+                (StorageTombstone.locked_until.is_(None)) | (StorageTombstone.locked_until < now),
+            )
+            .order_by(StorageTombstone.run_after)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        claimed = [(row.id, row.prefix) for row in rows]
+        for row in rows:
+            row.locked_until = now + timedelta(seconds=settings.STORAGE_GC_LEASE_SECONDS)
+        db.commit()
+        return claimed
+
+
+def _finish(done: list[UUID], failed: dict[UUID, str]):
+    with SessionLocal() as db:
+        for row in db.query(StorageTombstone).filter(StorageTombstone.id.in_(done + list(failed))).all():
+            row.locked_until = None
+            if row.id in failed:
+                row.attempts += 1
+                row.last_error = failed[row.id][:2000]
+                backoff = min(
+                    settings.STORAGE_GC_RETRY_BACKOFF_SECONDS * row.attempts, settings.STORAGE_GC_MAX_BACKOFF_SECONDS
+                )
+                row.run_after = func.now() + timedelta(seconds=backoff)
+            elif row.sweeps == 0 and settings.STORAGE_GC_RESWEEP_SECONDS > 0:
+                row.sweeps = 1
+                row.attempts = 0
+                row.last_error = None
+                row.run_after = func.now() + timedelta(seconds=settings.STORAGE_GC_RESWEEP_SECONDS)
+            else:
+                db.delete(row)
+        db.commit()
+
+
+def collect_once(limit: Optional[int] = None) -> int:
+    """Sweep one batch of due tombstones; returns how many were claimed."""
+    claimed = _claim(limit or settings.STORAGE_GC_BATCH_PREFIXES)
+    if not claimed:
+        return 0
+
+    failed: dict[UUID, str] = {}
+    owners: dict[str, UUID] = {}
+    for tombstone_id, prefix in claimed:
+        try:
+            for key in r2_storage.list_keys(prefix):
+                owners[key] = tombstone_id
+        except Exception as e:
+            failed[tombstone_id] = f"list failed: {e}"
+
+    failed_keys = r2_storage.delete_keys(owners)
+    for key in failed_keys:
+        failed.setdefault(owners[key], f"delete failed for {key}")
+
+    done = [tombstone_id for tombstone_id, _ in claimed if tombstone_id not in failed]
+    _finish(done, failed)
+    metrics.inc("storage_gc_deleted_objects", amount=len(owners) - len(failed_keys))
+    if failed:
+        metrics.inc("storage_gc_failures", amount=len(failed))
+        logger.warning(f"Storage GC: {len(failed)} of {len(claimed)} prefixes failed, will retry")
+    return len(claimed)
+
+
+def collector():
+    logger.info("Storage garbage collector started.")
+    while not stop_event.is_set():
+        try:
+            # A full batch means more may be due; otherwise wait for the next poll
+            if collect_once() >= settings.STORAGE_GC_BATCH_PREFIXES:
+                continue
+        except Exception as e:
+            logger.error(f"Storage garbage collection failed: {e}")
+        stop_event.wait(settings.STORAGE_GC_INTERVAL_SECONDS)
+    logger.info("Storage garbage collector stopped.")
+
+
+def start_collector():
+    global _collector
+    if not settings.STORAGE_GC_ENABLED:
+        logger.info("STORAGE_GC_ENABLED is false; tombstones are left for another process.")
+        return
+    stop_event.clear()
+    _collector = threading.Thread(target=collector, daemon=True, name="StorageGC")
+    _collector.start()
+
+
+def stop_collector(timeout: float = 10.0):
+    stop_event.set()
+    if _collector is not None:
+        _collector.join(timeout)
@@ -3,6 +3,7 @@ import json
 from google import genai
 from fastapi import HTTPException, status
 from core.logging import logger
+from services.ai.transport import build_transport
 from services.voice_context import build_context_payload, load_step_context
 
 MODEL = "gemini-2.5-flash-native-audio-preview-12-2025"
@@ -13,6 +14,8 @@ except Exception:
     logger.exception("Failed to create Google GenAI client")
     client = None
 
+transport = build_transport(client)
+
 
 def _system_instruction(context_json: str) -> str:
     return (
@@ -36,7 +39,7 @@ def _system_instruction(context_json: str) -> str:
 
 
 def create_ephemeral_token(db, user, step_id: str):
-    if client is None:
+    if transport is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail={"code": "ai_unavailable", "message": "AI client not available"},
@@ -50,8 +53,9 @@ def create_ephemeral_token(db, user, step_id: str):
     new_session_expire_time = now + timedelta(minutes=1)
 
     try:
-        token = client.auth_tokens.create(
-            config={
+        token = transport.create_auth_token(
+            MODEL,
+            {
                 "uses": 1,
                 "expire_time": expire_time,
                 "new_session_expire_time": new_session_expire_time,
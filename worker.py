@@ -0,0 +1,30 @@
+import signal
+import threading
+from core.database import init_db
+from core.logging import logger
+from services.image_processing import image_pool
+from services.material_queue import start_worker, stop_worker
+from services.storage_gc import start_collector, stop_collector
+
+# Standalone material worker process.
+# Run with `python worker.py` on any node; jobs are claimed from Postgres.
+
+def main():
+    init_db()
+    shutdown = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: shutdown.set())
+    signal.signal(signal.SIGINT, lambda *_: shutdown.set())
+
+    start_worker()
+    # Also where deleted materials' R2 objects get collected when the API
+    # runs on Lambda, whose frozen containers can't run background threads
+    start_collector()
+    logger.info("Material worker process started")
+    shutdown.wait()
+    logger.info("Shutting down material worker process")
+    stop_worker()
+    stop_collector()
+    image_pool.shutdown()
+
+if __name__ == "__main__":
+    main()